@@ -4,9 +4,9 @@ import re
 import os
 import pandas as pd
 from datetime import datetime
+from concurrent.futures import Future
 
 from database import (
-    init_db,
     get_user_by_email,
     update_user_profile,
     get_user_count
@@ -30,9 +30,11 @@ from auth import (
 from categories import (
     load_categories,
     get_bucket,
+    lookup_bucket,
     add_category
 )
 
+from comparison import show_comparison
 from dashboard import show_dashboard
 from utils import get_budget_map
 
@@ -44,12 +46,25 @@ from reports import (
     send_report_email
 )
 
-from expense_service import (add_expense, delete_expense, get_user_expenses)
+from expense_service import (
+    PAGE_SIZE,
+    DuplicateExpenseError,
+    add_expense,
+    add_expenses_bulk,
+    check_outcome,
+    clear_duplicate_flags,
+    count_user_expenses,
+    delete_expense,
+    delete_expenses,
+    get_expense_page,
+    get_flagged_duplicates,
+    page_cursor
+)
 from reports import generate_report
 
-from expense_db import create_expense_table
-
-create_expense_table()
+from migrations import run_migrations
+from recurring import FREQUENCIES, add_rule, get_rules, materialize_due, stop_rule
+from search import search_expenses
 
 
 # ---------------- EMAIL CONFIG ----------------
@@ -59,11 +74,30 @@ GMAIL_ID = st.secrets["GMAIL_ID"]
 APP_PASSWORD = st.secrets["APP_PASSWORD"]
 
 
+# ---------------- FORM OPTIONS ----------------
+
+SPENT_BY_OPTIONS = ["Self", "Wife", "Husband", "Child", "Parent", "Other"]
+
+PAYMENT_MODES = ["UPI", "Cash", "Card", "Net Banking", "Wallet"]
+
+
 # -------------------------------------------------
 # INIT
 # -------------------------------------------------
 
-init_db()
+run_migrations()
+
+
+# Catch up recurring expenses once per process and day (the date is
+# the cache key), not on every rerun of every session; the
+# `python recurring.py` timer catches up when nobody opens the app
+@st.cache_resource(show_spinner=False)
+def materialize_daily(day):
+
+    return materialize_due(day)
+
+
+materialize_daily(date.today())
 
 st.set_page_config(
     page_title="Expense Tracker",
@@ -229,6 +263,7 @@ def logout():
     st.session_state.user = None
     st.session_state.captcha = None
     st.session_state.page = "Dashboard"
+    st.session_state.pop("view_cursors", None)
 
     st.rerun()
 
@@ -245,6 +280,20 @@ def valid_phone(phone):
     return phone.isdigit() and len(phone) == 10
 
 
+# -------------------------------------------------
+# SAVE EXPENSE
+# -------------------------------------------------
+
+def save_expense(data, on_duplicate="reject"):
+
+    saved = add_expense(data, on_duplicate=on_duplicate)
+
+    # Write-behind hands back a Future; wait for its batch so a
+    # duplicate or a bad row is still reported on the form
+    if isinstance(saved, Future):
+        check_outcome(saved.result())
+
+
 
 # -------------------------------------------------
 # SIDEBAR (AFTER LOGIN)
@@ -258,7 +307,7 @@ if st.session_state.user:
 
         menu = st.radio(
             "Menu",
-            ["Dashboard", "Add Expense", "View Expenses", "My Profile", "Reports", "Logout"],
+            ["Dashboard", "Compare", "Add Expense", "View Expenses", "My Profile", "Reports", "Logout"],
             key="sidebar_menu"
         )
 
@@ -496,6 +545,18 @@ if st.session_state.page == "Dashboard":
     )
 
 
+# ================= COMPARE =================
+
+elif st.session_state.page == "Compare":
+
+    st.title("📈 Compare Months")
+
+    show_comparison(
+        st.session_state.user,
+        get_budget_map()
+    )
+
+
 # ================= ADD EXPENSE =================
 
 elif st.session_state.page == "Add Expense":
@@ -518,6 +579,135 @@ elif st.session_state.page == "Add Expense":
     cats = load_categories()
 
 
+    # ---------------- CSV IMPORT ----------------
+
+    with st.expander("📥 Import Expenses (CSV)"):
+
+        st.caption(
+            "Columns: date, amount, category, subcategory, "
+            "spent_by, payment_mode, notes, other_income"
+        )
+
+        uploaded = st.file_uploader(
+            "CSV File",
+            type="csv",
+            key="import_csv"
+        )
+
+        dup_choice = st.radio(
+            "Rows that look like duplicates",
+            ["Skip", "Merge into existing", "Import and flag for review"],
+            horizontal=True,
+            key="import_dups"
+        )
+
+        if uploaded and st.button("Import", key="import_btn"):
+
+            rows = pd.read_csv(uploaded).to_dict("records")
+
+            for row in rows:
+
+                row["email"] = user["email"]
+                row["name"] = user["name"]
+
+                if not isinstance(row.get("bucket"), str):
+                    row["bucket"] = lookup_bucket(
+                        cats,
+                        row.get("category"),
+                        row.get("subcategory")
+                    )
+
+            mode = {
+                "Skip": "reject",
+                "Merge into existing": "merge",
+                "Import and flag for review": "flag"
+            }[dup_choice]
+
+            outcomes = add_expenses_bulk(rows, on_duplicate=mode)
+
+            failed = [o for o in outcomes if not o["ok"]]
+            dups = [o for o in outcomes if o["duplicate_of"] is not None]
+
+            st.success(
+                f"✅ Imported {len(outcomes) - len(failed)} "
+                f"of {len(outcomes)} rows"
+            )
+
+            if dups:
+                st.info(f"{len(dups)} rows looked like duplicates")
+
+            if failed:
+                st.warning(f"{len(failed)} rows skipped")
+                st.dataframe(
+                    pd.DataFrame(failed),
+                    use_container_width=True,
+                    hide_index=True
+                )
+
+
+    # ---------------- RECURRING ----------------
+
+    with st.expander("🔁 Recurring Expenses"):
+
+        for rule in get_rules(user["email"]):
+
+            r1, r2 = st.columns([4, 1])
+
+            unit = {"monthly": "month", "weekly": "week", "days": "day"}[rule["frequency"]]
+            every = f"every {rule['interval']} {unit}(s)"
+
+            r1.write(
+                f"**{rule['category']} / {rule['subcategory']}** · "
+                f"₹{rule['amount']:,.0f} · {every} · "
+                f"next: {rule['next_due'] or 'done'}"
+            )
+
+            if r2.button("Stop", key=f"stop_rule_{rule['id']}"):
+                stop_rule(rule["id"], user["email"])
+                st.rerun()
+
+        rc1, rc2 = st.columns(2)
+
+        rule_cat = rc1.selectbox("Category", list(cats.keys()), key="rule_cat")
+        rule_sub = rc2.selectbox(
+            "Sub Category", list(cats.get(rule_cat, {}).keys()), key="rule_sub"
+        )
+
+        with st.form("rule_form"):
+
+            f1, f2 = st.columns(2)
+
+            rule_amount = f1.number_input("Amount", min_value=1.0, step=1.0)
+            rule_freq = f2.selectbox("Repeats", FREQUENCIES)
+
+            rule_interval = f1.number_input("Every", min_value=1, step=1)
+            rule_start = f2.date_input("Starts", value=date.today())
+
+            rule_mode = f1.selectbox("Payment Mode", PAYMENT_MODES)
+            rule_notes = f2.text_input("Notes", placeholder="e.g. House rent")
+
+            if st.form_submit_button("➕ Add Rule"):
+
+                add_rule({
+                    "email": user["email"],
+                    "name": user["name"],
+                    "amount": rule_amount,
+                    "category": rule_cat,
+                    "subcategory": rule_sub,
+                    "bucket": lookup_bucket(cats, rule_cat, rule_sub),
+                    "spent_by": "Self",
+                    "payment_mode": rule_mode,
+                    "notes": rule_notes,
+                    "frequency": rule_freq,
+                    "interval": rule_interval,
+                    "start_date": rule_start
+                })
+
+                # Starts today or earlier → write what is already due
+                materialize_due()
+                st.rerun()
+
+
     cat_list = list(cats.keys()) + ["➕ Add New"]
     sub_list = []
 
@@ -585,14 +775,14 @@ elif st.session_state.page == "Add Expense":
 
         spent_by = st.selectbox(
             "Spent By",
-            ["Self", "Wife", "Husband", "Child", "Parent", "Other"],
+            SPENT_BY_OPTIONS,
             index=0
         )
 
 
         payment = st.selectbox(
             "Payment Mode",
-            ["UPI", "Cash", "Card", "Net Banking", "Wallet"],
+            PAYMENT_MODES,
             index=0
         )
 
@@ -609,10 +799,47 @@ elif st.session_state.page == "Add Expense":
         submit = st.form_submit_button("💾 Save Expense")
 
 
+    # ---------------- DUPLICATE CONFIRM ----------------
+    # A repeat is most often a double-tapped Save, but two identical
+    # teas on one day are real; "Save anyway" keeps it, flagged
+
+    pending = st.session_state.get("pending_duplicate")
+
+    if pending and not submit:
+
+        st.warning(
+            "⚠️ This expense is already saved "
+            "(same date, amount, category and note)"
+        )
+
+        keep_col, drop_col = st.columns(2)
+
+        if keep_col.button("💾 Save anyway", key="dup_save"):
+
+            try:
+                save_expense(pending, on_duplicate="flag")
+
+            except ValueError as e:
+                st.error(f"Expense not saved: {e}")
+                st.stop()
+
+            del st.session_state["pending_duplicate"]
+
+            st.session_state.expense_added = True
+            st.rerun()
+
+        if drop_col.button("✖ Discard", key="dup_discard"):
+
+            del st.session_state["pending_duplicate"]
+            st.rerun()
+
+
         # ---------------- SUBMIT ----------------
 
     if submit:
 
+        st.session_state.pop("pending_duplicate", None)
+
 
         # ---------- Validation ----------
 
@@ -672,7 +899,17 @@ elif st.session_state.page == "Add Expense":
         }
 
 
-        add_expense(data)
+        try:
+            save_expense(data)
+
+        except DuplicateExpenseError:
+            # Ask before saving it again (see DUPLICATE CONFIRM)
+            st.session_state.pending_duplicate = data
+            st.rerun()
+
+        except ValueError as e:
+            st.error(f"Expense not saved: {e}")
+            st.stop()
 
 
         # ---------- Reset widgets safely ----------
@@ -710,25 +947,164 @@ elif st.session_state.page == "View Expenses":
 
     user = st.session_state.user
 
-    df = get_user_expenses(user["email"])
 
+    # --------------------------
+    # Search (FTS5, best match first)
+    # --------------------------
+
+    query = st.text_input(
+        "🔎 Search notes & categories",
+        placeholder="e.g. hotel diwali",
+        key="vf_search"
+    )
+
+    if query.strip():
+
+        hits = search_expenses(user["email"], query, limit=50)
+
+        if hits.empty:
+            st.info("No expenses match your search")
+        else:
+            st.caption(f"Top {len(hits)} matches")
+            st.dataframe(
+                hits.drop(columns=["id"]),
+                use_container_width=True, hide_index=True
+            )
+
+        st.divider()
+
+
+    # --------------------------
+    # Possible duplicates
+    # --------------------------
+
+    flagged = get_flagged_duplicates(user["email"])
+
+    if not flagged.empty:
+
+        with st.expander(f"⚠️ Possible Duplicates ({len(flagged)})"):
+
+            st.dataframe(flagged, use_container_width=True, hide_index=True)
+
+            picked = st.multiselect(
+                "Expense ids",
+                flagged["id"].tolist(),
+                key="dup_ids"
+            )
+
+            d1, d2 = st.columns(2)
+
+            if d1.button("🗑️ Delete", disabled=not picked, key="dup_delete"):
+                delete_expenses(picked, user["email"])
+                st.session_state.pop("dup_ids", None)
+                st.rerun()
+
+            if d2.button("✔ Not a Duplicate", disabled=not picked, key="dup_keep"):
+                clear_duplicate_flags(picked, user["email"])
+                st.session_state.pop("dup_ids", None)
+                st.rerun()
+
+
+    # --------------------------
+    # Filters (run inside SQLite)
+    # --------------------------
+
+    filters = {}
+
+    with st.expander("🔍 Filters"):
+
+        f1, f2 = st.columns(2)
+
+        date_range = f1.date_input("Date Range", value=(), key="vf_dates")
+
+        min_amt = f2.number_input("Min Amount", min_value=0.0, key="vf_min")
+        max_amt = f2.number_input(
+            "Max Amount (0 = no limit)", min_value=0.0, key="vf_max"
+        )
+
+        cats = load_categories()
+
+        sel_cats = f1.multiselect("Category", list(cats.keys()), key="vf_cats")
+
+        sub_opts = sorted({
+            sub for c in (sel_cats or cats) for sub in cats.get(c, {})
+        })
+
+        sel_subs = f1.multiselect("Sub Category", sub_opts, key="vf_subs")
+        sel_modes = f2.multiselect("Payment Mode", PAYMENT_MODES, key="vf_modes")
+        sel_by = f2.multiselect("Spent By", SPENT_BY_OPTIONS, key="vf_by")
+
+    if len(date_range) > 0:
+        filters["start"] = date_range[0]
+
+    if len(date_range) > 1:
+        filters["end"] = date_range[1]
+
+    if min_amt:
+        filters["min_amount"] = min_amt
+
+    if max_amt:
+        filters["max_amount"] = max_amt
+
+    for name, values in (
+        ("categories", sel_cats),
+        ("subcategories", sel_subs),
+        ("payment_modes", sel_modes),
+        ("spent_by", sel_by)
+    ):
+        if values:
+            filters[name] = values
+
+    # New filters → back to the first page
+    signature = repr(sorted(filters.items()))
+
+    if st.session_state.get("view_filters") != signature:
+        st.session_state.view_filters = signature
+        st.session_state.view_cursors = [None]
+
+
+    total = count_user_expenses(user["email"], **filters)
 
 
-    if df.empty:
-        st.info("No expenses yet")
+    if total == 0:
+        st.info("No matching expenses" if filters else "No expenses yet")
         st.stop()
 
 
+    # --------------------------
+    # Load Current Page
+    # --------------------------
+
+    # Keyset cursors: entry i is where page i starts
+    if "view_cursors" not in st.session_state:
+        st.session_state.view_cursors = [None]
+
+    cursors = st.session_state.view_cursors
+    page_no = len(cursors) - 1
+
+    df_view = get_expense_page(
+        user["email"],
+        after=cursors[-1],
+        page_size=PAGE_SIZE,
+        **filters
+    )
+
+    # Page emptied by a delete → step back
+    if df_view.empty and page_no > 0:
+        cursors.pop()
+        st.rerun()
+
+
     # --------------------------
     # Add Row Number
     # --------------------------
 
-    df_view = df.copy()
+    offset = page_no * PAGE_SIZE
 
     df_view.insert(
         0,
         "Row No",
-        range(1, len(df_view) + 1)
+        range(offset + 1, offset + len(df_view) + 1)
     )
     # # Hide DB id
     # df_view = df_view.drop(columns=["id"])
@@ -741,14 +1117,58 @@ elif st.session_state.page == "View Expenses":
 
     # st.dataframe(df_view[cols_to_show], use_container_width=True)
 
-    st.dataframe(
-        df_view,
+    # Tick rows to delete several at once; bumping the revision after a
+    # delete gives the editor a fresh key so old ticks don't carry over
+    if "view_editor_rev" not in st.session_state:
+        st.session_state.view_editor_rev = 0
+
+    edited = st.data_editor(
+        df_view.assign(Select=False),
         use_container_width=True, hide_index=True,
         column_config={
-                        "id": None    }
+                        "id": None,
+                        "Select": st.column_config.CheckboxColumn("🗑️")    },
+        column_order=["Select"] + list(df_view.columns),
+        disabled=list(df_view.columns),
+        key=f"view_editor_{page_no}_{st.session_state.view_editor_rev}"
     )
-    
 
+    selected_ids = edited.loc[edited["Select"], "id"].tolist()
+
+    if st.button(
+        f"🗑️ Delete Selected ({len(selected_ids)})",
+        disabled=not selected_ids
+    ):
+
+        if delete_expenses(selected_ids, user["email"]):
+            st.session_state.expense_deleted = True
+            st.session_state.view_editor_rev += 1
+            scroll_to_top()
+            st.rerun()
+        else:
+            st.error("❌ Unable to delete expenses")
+
+
+    # --------------------------
+    # Pager
+    # --------------------------
+
+    last_page = offset + len(df_view) >= total
+
+    prev_col, info_col, next_col = st.columns([1, 2, 1])
+
+    if prev_col.button("⬅ Previous", disabled=page_no == 0):
+        cursors.pop()
+        st.rerun()
+
+    info_col.caption(
+        f"Page {page_no + 1} of {-(-total // PAGE_SIZE)} · "
+        f"{total} expenses"
+    )
+
+    if next_col.button("Next ➡", disabled=last_page):
+        cursors.append(page_cursor(df_view))
+        st.rerun()
 
 
     # --------------------------
@@ -760,8 +1180,8 @@ elif st.session_state.page == "View Expenses":
 
     row_no = st.number_input(
         "Enter Row Number",
-        min_value=1,
-        max_value=len(df_view),
+        min_value=offset + 1,
+        max_value=offset + len(df_view),
         step=1
     )
 
@@ -773,7 +1193,7 @@ elif st.session_state.page == "View Expenses":
     if st.button("Delete Expense"):
 
         # Map Row → DB id
-        selected_row = df_view.iloc[row_no - 1]
+        selected_row = df_view.iloc[row_no - offset - 1]
 
         expense_id = int(selected_row["id"])
 
@@ -781,6 +1201,7 @@ elif st.session_state.page == "View Expenses":
         if success:
             # st.write("Deleting ID:", expense_id)
             st.session_state.expense_deleted = True
+            st.session_state.view_editor_rev += 1
             scroll_to_top()
             st.rerun()
         else:
@@ -0,0 +1,478 @@
+import argparse
+import hashlib
+import os
+import uuid
+from datetime import date
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from arrow_reader import EXPENSE_TYPES, decode_table, fetch_arrow
+import shards
+from db_pool import transaction
+from expense_db import fingerprint, from_epoch_day, to_epoch_day, to_paise
+from frame_cache import bump_version
+
+
+# -----------------------------------------
+# SETTINGS
+# -----------------------------------------
+
+ARCHIVE_DIR = Path("data/archive")
+
+# The current month plus this many before it stay in SQLite
+HOT_MONTHS = 2
+
+ARCHIVE_SCHEMA = pa.schema(list(EXPENSE_TYPES.items()))
+
+
+# -----------------------------------------
+# LAYOUT
+# -----------------------------------------
+# data/archive/user=<hash>/year_month=YYYY-MM/part-<id>.parquet
+# Columns are stored exactly as in SQLite (epoch days, paise).
+
+def user_dir(email):
+
+    key = hashlib.sha1(email.encode()).hexdigest()[:16]
+
+    return ARCHIVE_DIR / f"user={key}"
+
+
+def _month_of(day):
+
+    return from_epoch_day(day).strftime("%Y-%m")
+
+
+def _partitions(email, first=None, last=None):
+    """Archived months for a user, newest first, within [first, last]."""
+
+    base = user_dir(email)
+
+    if not base.exists():
+        return []
+
+    months = []
+
+    for entry in base.iterdir():
+
+        ym = entry.name.partition("=")[2]
+
+        if first and ym < first:
+            continue
+
+        if last and ym > last:
+            continue
+
+        months.append((ym, entry))
+
+    return sorted(months, reverse=True)
+
+
+# -----------------------------------------
+# ARCHIVE JOB
+# -----------------------------------------
+
+def archive_cutoff(today=None, hot_months=HOT_MONTHS):
+    """First day that stays hot; everything before it is closed."""
+
+    today = today or date.today()
+
+    index = today.year * 12 + today.month - 1 - hot_months
+
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def archive_closed_months(today=None, hot_months=HOT_MONTHS):
+    """Move every closed month out of SQLite into Parquet.
+
+    Files are renamed into place before the DELETE commits. If the
+    process dies in between, the rows are on both sides until the next
+    run: readers drop archived ids that are still live, and the next run
+    rewrites the partition with one copy of each row.
+    """
+
+    cutoff = to_epoch_day(archive_cutoff(today, hot_months))
+
+    moved = {}
+
+    for part in shards.fan_out(lambda path: _archive_file(path, cutoff)):
+        moved.update(part)
+
+    for email in moved:
+        bump_version(email)
+
+    return moved
+
+
+def _archive_file(path, cutoff):
+
+    moved = {}
+
+    with transaction(path) as conn:
+
+        conn.execute("BEGIN IMMEDIATE")
+
+        # Tells the rollup triggers this is a move, not a delete
+        conn.execute("INSERT INTO archive_hold VALUES (1)")
+
+        groups = conn.execute("""
+            SELECT
+                email,
+                strftime('%Y-%m', date * 86400, 'unixepoch'),
+                MIN(date),
+                MAX(date)
+            FROM expenses
+            WHERE date < ? AND email IS NOT NULL
+            GROUP BY 1, 2
+        """, (cutoff,)).fetchall()
+
+        # One (email, month) partition at a time keeps memory flat
+        for email, year_month, first, last in groups:
+
+            cur = conn.execute(f"""
+                SELECT {", ".join(EXPENSE_TYPES)}
+                FROM expenses
+                WHERE email = ? AND date BETWEEN ? AND ?
+                ORDER BY date DESC, id DESC
+            """, (email, first, last))
+
+            part = fetch_arrow(cur)
+
+            _merge_partition(email, year_month, part)
+
+            moved[email] = moved.get(email, 0) + part.num_rows
+
+        conn.execute(
+            "DELETE FROM expenses WHERE date < ? AND email IS NOT NULL",
+            (cutoff,)
+        )
+        conn.execute("DELETE FROM archive_hold")
+
+    return moved
+
+
+def _merge_partition(email, year_month, table):
+    """Write ``table`` as the partition's new file, folding in what is
+    already there minus copies of the same ids; those are left by an
+    interrupted run and are the same rows, still live."""
+
+    folder = user_dir(email) / f"year_month={year_month}"
+
+    old = sorted(folder.glob("part-*.parquet")) if folder.exists() else []
+
+    if old:
+
+        stored = ds.dataset(
+            [str(f) for f in old], format="parquet", schema=ARCHIVE_SCHEMA
+        ).to_table()
+
+        stored = stored.filter(
+            pc.invert(pc.is_in(stored.column("id"), table.column("id")))
+        )
+
+        table = pa.concat_tables([stored, table.cast(ARCHIVE_SCHEMA)]).sort_by(
+            [("date", "descending"), ("id", "descending")]
+        )
+
+    _write_partition(email, year_month, table)
+
+    for f in old:
+        f.unlink()
+
+
+def _write_partition(email, year_month, table):
+
+    folder = user_dir(email) / f"year_month={year_month}"
+    folder.mkdir(parents=True, exist_ok=True)
+
+    name = f"part-{uuid.uuid4().hex[:12]}.parquet"
+
+    tmp = folder / f".{name}.tmp"
+
+    pq.write_table(table.cast(ARCHIVE_SCHEMA), tmp)
+
+    os.replace(tmp, folder / name)
+
+
+# -----------------------------------------
+# FINGERPRINTS
+# -----------------------------------------
+# Archived rows leave expenses and with them their fingerprint, so
+# duplicate detection would miss a re-imported old statement. The
+# archive job's deletes copy the fingerprint here; expense_service
+# probes both tables.
+
+def create_fingerprint_table(conn):
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archived_fingerprints (
+            id INTEGER PRIMARY KEY,          -- the archived expense id
+            email TEXT,
+            fingerprint TEXT NOT NULL
+        )
+    """)
+
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_archived_fingerprints
+        ON archived_fingerprints (fingerprint)
+    """)
+
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_fingerprint_archive
+        AFTER DELETE ON expenses
+        WHEN OLD.fingerprint IS NOT NULL
+         AND EXISTS (SELECT 1 FROM archive_hold)
+        BEGIN
+            INSERT OR REPLACE INTO archived_fingerprints
+            VALUES (OLD.id, OLD.email, OLD.fingerprint);
+        END
+    """)
+
+
+def backfill_archived_fingerprints(conn):
+    """Fingerprints of rows archived before the table existed."""
+
+    table = archived_rows(conn, [
+        "id", "email", "date", "amount", "category", "subcategory", "notes"
+    ])
+
+    if table is None:
+        return
+
+    conn.executemany(
+        "INSERT OR REPLACE INTO archived_fingerprints VALUES (?,?,?)",
+        [
+            (row["id"], row["email"], fingerprint(
+                row["email"], row["date"], row["amount"],
+                row["category"], row["subcategory"], row["notes"]
+            ))
+            for row in table.to_pylist()
+        ]
+    )
+
+
+# -----------------------------------------
+# READ
+# -----------------------------------------
+
+def _filter_expression(
+    start=None,
+    end=None,
+    categories=None,
+    subcategories=None,
+    payment_modes=None,
+    spent_by=None,
+    min_amount=None,
+    max_amount=None,
+    after=None
+):
+    """Same filters as ``expense_service.build_filter``, for Parquet."""
+
+    expr = ds.field("id").is_valid()
+
+    if start is not None:
+        expr &= ds.field("date") >= to_epoch_day(start)
+
+    if end is not None:
+        expr &= ds.field("date") <= to_epoch_day(end)
+
+    for column, values in (
+        ("category", categories),
+        ("subcategory", subcategories),
+        ("payment_mode", payment_modes),
+        ("spent_by", spent_by)
+    ):
+
+        if values:
+            expr &= ds.field(column).isin(list(values))
+
+    if min_amount is not None:
+        expr &= ds.field("amount") >= to_paise(min_amount)
+
+    if max_amount is not None:
+        expr &= ds.field("amount") <= to_paise(max_amount)
+
+    if after is not None:
+
+        day, last_id = after
+
+        expr &= (ds.field("date") < day) | (
+            (ds.field("date") == day) & (ds.field("id") < last_id)
+        )
+
+    return expr
+
+
+def read_archive(email, columns, after=None, limit=None, **filters):
+    """Archived rows matching ``filters``, decoded, newest first.
+
+    Only partitions inside the date range (and before ``after``) are
+    opened. With ``limit``, months are read newest-first and reading
+    stops once enough rows are in hand.
+    """
+
+    start, end = filters.get("start"), filters.get("end")
+
+    first = start and _month_of(to_epoch_day(start))
+    last = end and _month_of(to_epoch_day(end))
+
+    if after is not None:
+        last = min(filter(None, [last, _month_of(after[0])]))
+
+    expr = _filter_expression(after=after, **filters)
+
+    pieces = []
+    found = 0
+
+    for _, folder in _partitions(email, first, last):
+
+        files = sorted(str(p) for p in folder.glob("part-*.parquet"))
+
+        piece = ds.dataset(
+            files, format="parquet", schema=ARCHIVE_SCHEMA
+        ).to_table(columns=list(columns), filter=expr)
+
+        pieces.append(piece)
+        found += piece.num_rows
+
+        if limit is not None and found >= limit:
+            break
+
+    if not pieces:
+        return None
+
+    # Callers include date and id in ``columns`` for this sort
+    table = pa.concat_tables(pieces).sort_by(
+        [("date", "descending"), ("id", "descending")]
+    )
+
+    return decode_table(_drop_repeats(table))
+
+
+def _drop_repeats(table):
+    """One row per id; a crash while a partition is rewritten can leave
+    the old and the new file side by side. Expects the sort above, which
+    puts copies of an id next to each other."""
+
+    if table.num_rows < 2:
+        return table
+
+    ids = table.column("id").combine_chunks()
+
+    repeat = pc.equal(ids.slice(1), ids.slice(0, len(ids) - 1))
+
+    return table.filter(pa.concat_arrays([
+        pa.array([True]), pc.invert(pc.fill_null(repeat, False))
+    ]))
+
+
+def archived_rows(conn, columns, email=None):
+    """Raw archived rows (epoch days, paise) of the users whose live
+    rows are in ``conn``'s file; used to backfill derived tables.
+
+    With ``email`` only that user's partitions are opened.
+    """
+
+    root = user_dir(email) if email else ARCHIVE_DIR
+    pattern = "year_month=*/part-*.parquet" if email else "user=*/year_month=*/part-*.parquet"
+
+    files = [str(p) for p in root.glob(pattern)]
+
+    if not files:
+        return None
+
+    table = ds.dataset(
+        files, format="parquet", schema=ARCHIVE_SCHEMA
+    ).to_table(
+        columns=list(columns),
+        filter=(ds.field("email") == email) if email else None
+    )
+
+    if shards.sharded():
+
+        here = os.path.abspath(conn.execute("PRAGMA database_list").fetchone()[2])
+
+        emails = [
+            e for e in pc.unique(table.column("email")).to_pylist()
+            if e and os.path.abspath(shards.shard_path(shards.shard_of(e))) == here
+        ]
+
+        table = table.filter(pc.is_in(table.column("email"), pa.array(emails, pa.string())))
+
+    return table
+
+
+# -----------------------------------------
+# DELETE
+# -----------------------------------------
+
+def remove_archived(email, ids):
+    """Rewrite the user's partitions without ``ids``.
+
+    Returns the removed rows as stored (epoch days, paise) so callers
+    can take them off the rollup, daily totals and search index, or
+    None when no id was archived. The caller's SQLite transaction should
+    commit right after; a crash in between leaves totals that a rebuild
+    (python rollup.py / daily_index.py) corrects.
+    """
+
+    wanted = pa.array(sorted(ids), pa.int64())
+
+    removed = []
+
+    for year_month, folder in _partitions(email):
+
+        files = sorted(folder.glob("part-*.parquet"))
+
+        data = ds.dataset([str(f) for f in files], format="parquet", schema=ARCHIVE_SCHEMA)
+
+        # Cheap id-only probe before reading whole partitions
+        if not pc.any(pc.is_in(data.to_table(columns=["id"]).column("id"), wanted)).as_py():
+            continue
+
+        table = data.to_table()
+
+        hit = pc.and_(
+            pc.is_in(table.column("id"), wanted),
+            pc.equal(table.column("email"), email)
+        )
+
+        removed.append(table.filter(hit))
+
+        keep = table.filter(pc.invert(hit))
+
+        if keep.num_rows:
+            _write_partition(email, year_month, keep)
+
+        for f in files:
+            f.unlink()
+
+        if not keep.num_rows:
+            folder.rmdir()
+
+    if not removed:
+        return None
+
+    return pa.concat_tables(removed)
+
+
+# -----------------------------------------
+# CLI: python archive.py [--keep N]
+# -----------------------------------------
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Move closed months to the Parquet archive"
+    )
+    parser.add_argument("--keep", type=int, default=HOT_MONTHS,
+                        help="past months to keep hot besides the current one")
+    args = parser.parse_args()
+
+    moved = archive_closed_months(hot_months=args.keep)
+
+    print(f"Archived {sum(moved.values())} rows for {len(moved)} users")
@@ -0,0 +1,138 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+# -----------------------------------------
+# SETTINGS
+# -----------------------------------------
+
+FETCH_BATCH = 65536
+
+
+# -----------------------------------------
+# STORED COLUMN TYPES
+# -----------------------------------------
+# Fixed types keep every record batch on the same schema, even a batch
+# that happens to be all NULL in some column.
+
+EXPENSE_TYPES = {
+
+    "id": pa.int64(),
+    "email": pa.string(),
+    "name": pa.string(),
+
+    "date": pa.int32(),          # epoch days
+    "amount": pa.int64(),        # paise
+
+    "category": pa.string(),
+    "subcategory": pa.string(),
+    "bucket": pa.string(),
+
+    "spent_by": pa.string(),
+    "payment_mode": pa.string(),
+
+    "notes": pa.string(),
+
+    "other_income": pa.int64()   # paise
+}
+
+MONEY_COLUMNS = ("amount", "other_income")
+
+
+# -----------------------------------------
+# CURSOR -> ARROW
+# -----------------------------------------
+
+def fetch_arrow(cur, types=EXPENSE_TYPES, batch_size=FETCH_BATCH):
+    """Drain a cursor into an Arrow table, ``batch_size`` rows at a time.
+
+    Each batch of row tuples is converted as one struct array, so Arrow
+    splits the rows into typed columns in C++; transposing them in
+    Python first (``zip(*rows)``) cost more than the fetch saved.
+    """
+
+    names = [d[0] for d in cur.description]
+    schema = pa.schema([(n, types.get(n, pa.string())) for n in names])
+
+    row_type = pa.struct(list(schema))
+
+    batches = []
+
+    while True:
+
+        rows = cur.fetchmany(batch_size)
+
+        if not rows:
+            break
+
+        batches.append(pa.RecordBatch.from_struct_array(
+            pa.array(rows, type=row_type)
+        ))
+
+    return pa.Table.from_batches(batches, schema=schema)
+
+
+# -----------------------------------------
+# DECODE STORED COLUMNS
+# -----------------------------------------
+
+def decode_table(table):
+    """Epoch days -> date32 and paise -> rupees, column by column."""
+
+    names = table.column_names
+
+    if "date" in names:
+
+        i = names.index("date")
+
+        # int32 days since epoch is exactly date32's layout
+        table = table.set_column(
+            i, "date",
+            table.column(i).cast(pa.int32()).cast(pa.date32())
+        )
+
+    for col in MONEY_COLUMNS:
+
+        if col in names:
+
+            i = names.index(col)
+
+            table = table.set_column(
+                i, col,
+                pc.divide(table.column(i).cast(pa.float64()), 100.0)
+            )
+
+    return table
+
+
+# -----------------------------------------
+# ARROW -> PANDAS
+# -----------------------------------------
+
+def to_frame(table, dtype_backend=None):
+    """Convert a decoded table to pandas.
+
+    ``dtype_backend="pyarrow"`` keeps every column Arrow-backed; the
+    default gives NumPy columns with ``date`` as datetime64.
+    """
+
+    if dtype_backend == "pyarrow":
+
+        if "date" in table.column_names:
+
+            i = table.column_names.index("date")
+
+            table = table.set_column(
+                i, "date",
+                table.column(i).cast(pa.timestamp("ms"))
+            )
+
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+    df = table.to_pandas(date_as_object=False)
+
+    if "date" in df.columns:
+        df["date"] = df["date"].astype("datetime64[ns]")
+
+    return df
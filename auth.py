@@ -56,13 +56,11 @@ def login_user(email, password):
 
 def email_exists(email):
 
-    conn = get_connection()
-    cur = conn.cursor()
+    with get_connection() as conn:
 
-    cur.execute("SELECT id FROM users WHERE email=?", (email,))
-    user = cur.fetchone()
-
-    conn.close()
+        user = conn.execute(
+            "SELECT id FROM users WHERE email=?", (email,)
+        ).fetchone()
 
     return True if user else False
 
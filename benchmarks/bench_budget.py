@@ -0,0 +1,130 @@
+"""Compare the row-wise budget analysis with the vectorized engine.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_budget --rows 1000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from budget_engine import analyze
+from utils import get_bucket_categories, get_budget_map, map_to_bucket
+
+
+def legacy_budget_analysis(df, budget_map, income):
+    """``dashboard.budget_analysis`` as it was before the engine."""
+
+    df = df.copy()
+
+    df["final_bucket"] = df["category"].apply(map_to_bucket)
+
+    bucket_categories = get_bucket_categories()
+
+    result = []
+
+    for bucket, percent in budget_map.items():
+
+        limit = income * percent / 100
+
+        spent = df[df["final_bucket"] == bucket]["amount"].sum()
+
+        status = "Overspent🔴" if spent > limit else "OK🟢"
+
+        cats = bucket_categories.get(bucket, [])
+
+        result.append((
+            bucket,
+            ", ".join(cats) if cats else "-",
+            round(limit, 2),
+            round(spent, 2),
+            status
+        ))
+
+    return pd.DataFrame(
+        result, columns=["Bucket", "Categories", "Limit", "Spent", "Status"]
+    )
+
+
+def make_rows(rows, users, months, seed=7):
+
+    rng = np.random.default_rng(seed)
+
+    cats = np.array([
+        "Food", "Bills", "EMI", "Health", "Savings",
+        "Personal", "Family", "Transport", "Miscellaneous", "Gifts"
+    ])
+
+    return pd.DataFrame({
+        "email": pd.Categorical(
+            [f"user{i}@example.com" for i in rng.integers(0, users, rows)]
+        ),
+        "year_month": pd.Categorical(
+            [f"2025-{m:02d}" for m in rng.integers(1, months + 1, rows)]
+        ),
+        "category": cats[rng.integers(0, len(cats), rows)],
+        "amount": rng.integers(10, 5000, rows).astype(float)
+    })
+
+
+def timed(fn):
+
+    start = time.perf_counter()
+    result = fn()
+
+    return time.perf_counter() - start, result
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--months", type=int, default=12)
+    args = parser.parse_args()
+
+    budget = get_budget_map()
+    income = 80_000.0
+
+    df = make_rows(args.rows, args.users, args.months)
+
+    print(f"{args.rows:,} rows")
+    print(f"{'case':<36}{'seconds':>10}{'speedup':>10}")
+
+    # One frame, one income: the dashboard call
+    t_old, old = timed(lambda: legacy_budget_analysis(df, budget, income))
+    t_new, new = timed(lambda: analyze(df, budget, income))
+
+    pd.testing.assert_frame_equal(old, new, check_dtype=False)
+
+    print(f"{'single frame, legacy':<36}{t_old:>10.3f}")
+    print(f"{'single frame, engine':<36}{t_new:>10.3f}{t_old / t_new:>9.1f}x")
+
+    # Every user-month: legacy loops over groups, engine does one pass
+    by = ["email", "year_month"]
+
+    def legacy_batch():
+        return pd.concat([
+            legacy_budget_analysis(part, budget, income)
+            .assign(email=key[0], year_month=key[1])
+            for key, part in df.groupby(by, observed=True)
+        ], ignore_index=True)
+
+    t_old, old = timed(legacy_batch)
+    t_new, new = timed(lambda: analyze(df, budget, income, by=by))
+
+    pd.testing.assert_frame_equal(
+        old[new.columns], new.astype({k: str for k in by}), check_dtype=False
+    )
+
+    groups = len(new) // len(budget)
+
+    print(f"{f'{groups:,} user-months, legacy loop':<36}{t_old:>10.3f}")
+    print(f"{f'{groups:,} user-months, engine':<36}{t_new:>10.3f}{t_old / t_new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
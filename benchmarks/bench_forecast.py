@@ -0,0 +1,130 @@
+"""Time the forecast engine: one batched pass over many users and the
+single-user projection behind the dashboard (target: under 50 ms),
+then forecast_all end to end on a scratch sharded database.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_forecast --users 10000 --shards 4
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from expense_db import to_epoch_day
+from forecast import LOOKBACK, project
+
+
+def make_window(users, categories, today, density=0.3, seed=7):
+    """Daily totals as stored (epoch days, paise) for the lookback window."""
+
+    rng = np.random.default_rng(seed)
+
+    now = to_epoch_day(today)
+
+    series = users * categories
+    days = LOOKBACK + 1
+
+    hit = rng.random((series, days)) < density
+    s, d = np.nonzero(hit)
+
+    return pd.DataFrame({
+        "email": pd.Categorical([f"user{i}@example.com" for i in s // categories]),
+        "category": pd.Categorical([f"cat{i}" for i in s % categories]),
+        "day": now - LOOKBACK + d,
+        "amount": rng.integers(1_000, 500_000, len(s))
+    })
+
+
+def sharded_smoke(shard_count, today, users=2, days=60):
+    """forecast_all over ``shard_count`` shard files holding fewer users
+    than files, so some shards have nothing in the window."""
+
+    import expense_service
+    import shards
+    from forecast import forecast_all
+    from migrations import run_migrations
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_forecast_"))
+
+    shards.SHARD_COUNT = shard_count
+
+    run_migrations()
+
+    emails = [f"user{i}@example.com" for i in range(users)]
+
+    expense_service.add_expenses_bulk([
+        {
+            "email": email,
+            "name": "Bench",
+            "date": (today - timedelta(days=d)).isoformat(),
+            "amount": 100 + d,
+            "category": category,
+            "notes": f"{category} {d}"
+        }
+        for email in emails
+        for category in ("Food", "Bills")
+        for d in range(days)
+    ])
+
+    empty = sum(1 for rows in shards.shard_sizes().values() if not rows)
+
+    t, result = timed(lambda: forecast_all(today))
+
+    assert set(result["email"]) == set(emails)
+    assert len(result) == users * 2
+
+    return t, empty
+
+
+def timed(fn, repeat=1):
+
+    start = time.perf_counter()
+
+    for _ in range(repeat):
+        result = fn()
+
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--categories", type=int, default=8)
+    parser.add_argument("--shards", type=int, default=4)
+    args = parser.parse_args()
+
+    today = date.today()
+
+    frame = make_window(args.users, args.categories, today)
+
+    print(f"{args.users:,} users x {args.categories} categories, {len(frame):,} daily rows")
+
+    t_batch, result = timed(lambda: project(frame, today))
+
+    assert len(result) == args.users * args.categories
+
+    print(f"{'batch, all users':<36}{t_batch:>10.3f} s")
+    print(f"{'batch, per user':<36}{t_batch / args.users * 1000:>10.3f} ms")
+
+    one = frame[frame["email"] == "user0@example.com"].astype(
+        {"email": str, "category": str}
+    )
+
+    t_one, _ = timed(lambda: project(one, today), repeat=50)
+
+    print(f"{'single user (interactive)':<36}{t_one * 1000:>10.3f} ms")
+
+    t_all, empty = sharded_smoke(args.shards, today)
+
+    print(f"{f'forecast_all, {args.shards} shards ({empty} empty)':<36}{t_all * 1000:>10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Compare the pd.read_sql read path with the Arrow fetchmany path.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_read_path --rows 500000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+
+
+def seed(rows):
+
+    import expense_service
+    from migrations import run_migrations
+
+    run_migrations()
+
+    rng = random.Random(7)
+    cats = ["Food", "Bills", "Transport", "Health", "Savings", "Other"]
+
+    batch = [
+        {
+            "email": "bench@example.com",
+            "name": "Bench",
+            "date": f"20{rng.randint(15, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "amount": rng.randint(10, 50000) / 10,
+            "category": rng.choice(cats),
+            "subcategory": "Misc",
+            "bucket": "Lifestyle",
+            "spent_by": "Self",
+            "payment_mode": "UPI",
+            "notes": f"note {i}",
+            "other_income": 0
+        }
+        for i in range(rows)
+    ]
+
+    expense_service.add_expenses_bulk(batch, chunk_size=10000)
+
+
+def best_of(fn, repeat):
+
+    times = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_read_"))
+
+    seed(args.rows)
+
+    import expense_service as es
+    from arrow_reader import to_frame
+    from expense_db import decode_expenses, get_connection
+
+    email = "bench@example.com"
+    cols = ", ".join(es.VIEW_COLUMNS)
+    query = f"SELECT {cols} FROM expenses WHERE email = ? ORDER BY date DESC"
+
+    def legacy():
+        with get_connection() as conn:
+            return decode_expenses(pd.read_sql(query, conn, params=(email,)))
+
+    def arrow_table():
+        return es._query_arrow(email, query, (email,))
+
+    def arrow_numpy():
+        return to_frame(es._query_arrow(email, query, (email,)))
+
+    def arrow_backed():
+        return to_frame(es._query_arrow(email, query, (email,)), "pyarrow")
+
+    def arrow_projected():
+        q = "SELECT date, amount, category FROM expenses WHERE email = ?"
+        return to_frame(es._query_arrow(email, q, (email,)))
+
+    paths = [
+        ("pd.read_sql (baseline)", legacy),
+        ("arrow table", arrow_table),
+        ("arrow -> numpy frame", arrow_numpy),
+        ("arrow -> pyarrow frame", arrow_backed),
+        ("arrow projected (3 cols)", arrow_projected),
+    ]
+
+    # One untimed pass so every path reads from a warm page cache
+    for _, fn in paths:
+        fn()
+
+    times = [(name, best_of(fn, args.repeat)) for name, fn in paths]
+
+    base = times[0][1]
+
+    print(f"{args.rows:,} rows, best of {args.repeat}, warm")
+    print(f"{'path':<28}{'seconds':>10}{'speedup':>10}")
+
+    for name, t in times:
+        print(f"{name:<28}{t:>10.3f}{base / t:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import functools
+
+import numpy as np
+import pandas as pd
+
+from utils import get_bucket_categories, get_category_bucket_map
+
+
+# ---------------------------------
+# SETTINGS
+# ---------------------------------
+
+DEFAULT_BUCKET = "Lifestyle + Personal"
+
+OK = "OK🟢"
+OVERSPENT = "Overspent🔴"
+
+COLUMNS = ["Bucket", "Categories", "Limit", "Spent", "Status"]
+
+
+# ---------------------------------
+# CATEGORY -> BUCKET CODES
+# ---------------------------------
+# Categories become categorical codes once per call and a small lookup
+# array turns codes into bucket positions; no per-row Python.
+
+CATEGORIES = list(get_category_bucket_map())
+
+
+@functools.lru_cache(maxsize=32)
+def _bucket_table(buckets):
+    """Bucket position (or -1) per category code; last slot = unknown."""
+
+    mapping = get_category_bucket_map()
+
+    def position(bucket):
+        return buckets.index(bucket) if bucket in buckets else -1
+
+    return np.array(
+        [position(mapping[c]) for c in CATEGORIES] + [position(DEFAULT_BUCKET)]
+    )
+
+
+def bucket_codes(categories, buckets):
+    """Position in ``buckets`` for every category; -1 if not budgeted."""
+
+    codes = pd.Categorical(categories, categories=CATEGORIES).codes
+
+    # Unknown categories have code -1, which indexes the last slot
+    return _bucket_table(tuple(buckets))[codes]
+
+
+def _category_text(buckets):
+
+    listed = get_bucket_categories()
+
+    return [", ".join(listed.get(b, [])) or "-" for b in buckets]
+
+
+# ---------------------------------
+# BUDGET ANALYSIS
+# ---------------------------------
+
+def analyze(df, budget_map, income, by=None):
+    """Spend per budget bucket against ``budget_map`` percentages.
+
+    ``df`` needs ``category`` and ``amount``. Without ``by`` this is the
+    dashboard table for one user-month. With ``by`` (e.g. ``["email",
+    "year_month"]``) every group is analysed in the same single pass and
+    ``income`` may be a mapping / Series keyed like the groups.
+    """
+
+    by = list(by or [])
+
+    if df.empty:
+        return pd.DataFrame(columns=by + COLUMNS)
+
+    buckets = list(budget_map)
+    percents = np.array(list(budget_map.values()), dtype=float)
+
+    codes = bucket_codes(df["category"], buckets)
+    amount = df["amount"].to_numpy(dtype=float)
+
+    keep = codes >= 0
+
+    if not by:
+
+        spent = np.bincount(
+            codes[keep], weights=amount[keep], minlength=len(buckets)
+        )[None, :]
+
+        groups = None
+        income = np.array([float(income)])
+
+    else:
+
+        frame = df.loc[keep, by].assign(_bucket=codes[keep], _amount=amount[keep])
+
+        table = (
+            frame.groupby(by + ["_bucket"], observed=True)["_amount"].sum()
+            .unstack("_bucket", fill_value=0.0)
+            .reindex(columns=range(len(buckets)), fill_value=0.0)
+        )
+
+        spent = table.to_numpy()
+        groups = table.index
+
+        if np.isscalar(income):
+            income = np.full(len(groups), float(income))
+        else:
+            income = pd.Series(income).reindex(groups).fillna(0).to_numpy(dtype=float)
+
+    limit = income[:, None] * percents[None, :] / 100
+
+    n = len(spent)
+
+    result = pd.DataFrame({
+        "Bucket": np.tile(buckets, n),
+        "Categories": np.tile(_category_text(buckets), n),
+        "Limit": limit.ravel().round(2),
+        "Spent": spent.ravel().round(2),
+        "Status": np.where(spent > limit, OVERSPENT, OK).ravel()
+    })
+
+    if groups is not None:
+
+        keys = groups.to_frame(index=False).loc[
+            np.repeat(np.arange(n), len(buckets))
+        ].reset_index(drop=True)
+
+        result = pd.concat([keys, result], axis=1)
+
+    return result
+
+
+def overspent_buckets(result):
+
+    return result.loc[result["Status"] == OVERSPENT, "Bucket"].tolist()
@@ -36,7 +36,10 @@ def save_categories(data):
 
 def get_bucket(category, subcategory):
 
-    data = load_categories()
+    return lookup_bucket(load_categories(), category, subcategory)
+
+
+def lookup_bucket(data, category, subcategory):
 
     if category in data:
         if subcategory in data[category]:
@@ -0,0 +1,222 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+
+from budget_engine import bucket_codes
+from rollup import get_month_counts, get_rollup_range
+
+
+# ---------------------------------
+# SETTINGS
+# ---------------------------------
+
+MAX_MONTHS = 24
+
+GROUPS = {"Category": "category", "Bucket": "budget_bucket"}
+
+UNBUDGETED = "Unbudgeted"
+
+
+# ---------------------------------
+# MONTH HELPERS
+# ---------------------------------
+
+def shift_month(year_month, k):
+
+    year, month = map(int, year_month.split("-"))
+
+    year, month = divmod(year * 12 + month - 1 + k, 12)
+
+    return f"{year:04d}-{month + 1:02d}"
+
+
+def month_window(last, n):
+    """``n`` consecutive months ending at ``last``, oldest first."""
+
+    return [shift_month(last, k) for k in range(1 - n, 1)]
+
+
+# ---------------------------------
+# PRE-AGGREGATED SERIES
+# ---------------------------------
+# Everything here starts from the monthly rollup: one range scan of at
+# most (months x categories) rows, so 24 months cost about what one
+# month does and no expense rows are read.
+
+def rollup_series(email, first, last, budget_map):
+
+    df = get_rollup_range(email, first, last)
+
+    buckets = list(budget_map)
+    codes = bucket_codes(df["category"], buckets)
+
+    # Code -1 (not budgeted) picks the last name
+    df["budget_bucket"] = np.array(buckets + [UNBUDGETED])[codes]
+
+    return df
+
+
+def month_matrix(email, months, budget_map, by="category"):
+    """Spend per ``by`` (rows) and month (columns), zeros where empty."""
+
+    df = rollup_series(email, months[0], months[-1], budget_map)
+
+    table = df.pivot_table(
+        index=by,
+        columns="year_month",
+        values="amount",
+        aggfunc="sum",
+        fill_value=0
+    )
+
+    table = table.reindex(columns=months, fill_value=0)
+    table.index.name = None
+    table.columns.name = None
+
+    return table.loc[table.sum(axis=1).sort_values(ascending=False).index]
+
+
+def year_over_year(email, year, budget_map, by="category"):
+    """Spend per ``by`` in ``year`` against the year before."""
+
+    df = rollup_series(email, f"{year - 1}-01", f"{year}-12", budget_map)
+
+    df["year"] = df["year_month"].str[:4].astype(int)
+
+    table = df.pivot_table(
+        index=by,
+        columns="year",
+        values="amount",
+        aggfunc="sum",
+        fill_value=0
+    ).reindex(columns=[year - 1, year], fill_value=0)
+
+    table.index.name = None
+    table.columns = [str(c) for c in table.columns]
+
+    before, after = table[str(year - 1)], table[str(year)]
+
+    # Blank where there was nothing to compare against
+    table["Change %"] = ((after - before) / before.where(before > 0) * 100).round(1)
+
+    return table.sort_values(str(year), ascending=False)
+
+
+def monthly_totals(email, year, budget_map):
+    """Total spend per calendar month for ``year`` and the year before."""
+
+    df = rollup_series(email, f"{year - 1}-01", f"{year}-12", budget_map)
+
+    totals = df.groupby("year_month")["amount"].sum()
+
+    return pd.DataFrame({
+        "Month": [f"{m:02d}" for m in range(1, 13)] * 2,
+        "Year": [str(year - 1)] * 12 + [str(year)] * 12,
+        "Amount": [
+            totals.get(f"{y}-{m:02d}", 0.0)
+            for y in (year - 1, year)
+            for m in range(1, 13)
+        ]
+    })
+
+
+# ---------------------------------
+# COMPARISON UI
+# ---------------------------------
+
+def show_comparison(user, budget_map):
+
+    counts = get_month_counts(user["email"])
+
+    if not counts:
+        st.info("📭 No expenses yet. Start adding some!")
+        return
+
+    mode = st.radio(
+        "Compare",
+        ["Last N months", "Year over year"],
+        horizontal=True,
+        key="cmp_mode"
+    )
+
+    group = st.radio(
+        "Group by",
+        list(GROUPS),
+        horizontal=True,
+        key="cmp_group"
+    )
+
+    by = GROUPS[group]
+
+
+    # ---------------- Last N Months ----------------
+
+    if mode == "Last N months":
+
+        months = sorted(counts)
+
+        n = st.slider(
+            "Months",
+            min_value=2,
+            max_value=MAX_MONTHS,
+            value=min(6, MAX_MONTHS),
+            key="cmp_months"
+        )
+
+        table = month_matrix(
+            user["email"],
+            month_window(months[-1], n),
+            budget_map,
+            by
+        )
+
+        long = table.reset_index(names=group).melt(
+            id_vars=group, var_name="Month", value_name="Amount"
+        )
+
+        fig = px.bar(
+            long,
+            x="Month",
+            y="Amount",
+            color=group,
+            title=f"Spending by {group.lower()}, last {n} months"
+        )
+
+        st.plotly_chart(fig, use_container_width=True)
+
+        st.dataframe(table, use_container_width=True)
+
+        return
+
+
+    # ---------------- Year Over Year ----------------
+
+    years = sorted({int(m[:4]) for m in counts}, reverse=True)
+
+    current = date.today().year
+
+    year = st.selectbox(
+        "Year",
+        years,
+        index=years.index(current) if current in years else 0,
+        key="cmp_year"
+    )
+
+    fig = px.bar(
+        monthly_totals(user["email"], year, budget_map),
+        x="Month",
+        y="Amount",
+        color="Year",
+        barmode="group",
+        title=f"{year} vs {year - 1}"
+    )
+
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.dataframe(
+        year_over_year(user["email"], year, budget_map, by),
+        use_container_width=True
+    )
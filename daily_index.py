@@ -0,0 +1,260 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+import shards
+from archive import archived_rows
+from db_pool import transaction
+from expense_db import get_connection, to_epoch_day
+from frame_cache import user_cached
+
+
+# -----------------------------------------
+# DAILY TOTALS
+# -----------------------------------------
+# One row per (email, day, category), kept current by triggers on
+# expenses like the monthly rollup. Deletes made by the archive job are
+# skipped (archive_hold), so archived days keep their totals.
+
+def _key(row):
+
+    return (
+        f"COALESCE({row}.email, ''), "
+        f"{row}.date, "
+        f"COALESCE({row}.category, '')"
+    )
+
+
+def _add(row):
+
+    return f"""
+        INSERT INTO daily_totals (email, day, category, amount, row_count)
+        VALUES ({_key(row)}, COALESCE({row}.amount, 0), 1)
+        ON CONFLICT (email, day, category) DO UPDATE SET
+            amount = amount + excluded.amount,
+            row_count = row_count + 1;
+    """
+
+
+def _subtract(row):
+
+    match = f"(email, day, category) = ({_key(row)})"
+
+    return f"""
+        UPDATE daily_totals SET
+            amount = amount - COALESCE({row}.amount, 0),
+            row_count = row_count - 1
+        WHERE {match};
+
+        DELETE FROM daily_totals
+        WHERE {match} AND row_count <= 0;
+    """
+
+
+def create_daily_totals(conn):
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_totals (
+
+            email TEXT NOT NULL,
+            day INTEGER NOT NULL,            -- epoch days
+            category TEXT NOT NULL,
+
+            amount INTEGER NOT NULL DEFAULT 0,     -- paise
+            row_count INTEGER NOT NULL DEFAULT 0,
+
+            PRIMARY KEY (email, day, category)
+        ) WITHOUT ROWID
+    """)
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_daily_insert
+        AFTER INSERT ON expenses
+        WHEN NEW.date IS NOT NULL
+        BEGIN
+            {_add("NEW")}
+        END
+    """)
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_daily_delete
+        AFTER DELETE ON expenses
+        WHEN OLD.date IS NOT NULL
+         AND NOT EXISTS (SELECT 1 FROM archive_hold)
+        BEGIN
+            {_subtract("OLD")}
+        END
+    """)
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_daily_update_old
+        AFTER UPDATE OF email, date, amount, category ON expenses
+        WHEN OLD.date IS NOT NULL
+        BEGIN
+            {_subtract("OLD")}
+        END
+    """)
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_daily_update_new
+        AFTER UPDATE OF email, date, amount, category ON expenses
+        WHEN NEW.date IS NOT NULL
+        BEGIN
+            {_add("NEW")}
+        END
+    """)
+
+
+def backfill_daily_totals(conn, email=None):
+
+    if email is None:
+        conn.execute("DELETE FROM daily_totals")
+        where, params = "WHERE e.date IS NOT NULL", ()
+
+    else:
+        conn.execute("DELETE FROM daily_totals WHERE email = ?", (email,))
+        where, params = "WHERE e.date IS NOT NULL AND e.email = ?", (email,)
+
+    conn.execute(f"""
+        INSERT INTO daily_totals
+        SELECT
+            COALESCE(e.email, ''),
+            e.date,
+            COALESCE(e.category, ''),
+            SUM(COALESCE(e.amount, 0)),
+            COUNT(*)
+        FROM expenses e
+        {where}
+        GROUP BY 1, 2, 3
+    """, params)
+
+    # Archived days are gone from expenses but keep their totals
+    table = archived_rows(conn, ARCHIVED_COLUMNS, email)
+
+    if table is not None:
+        merge_archived(conn, table)
+
+
+ARCHIVED_COLUMNS = ["email", "date", "category", "amount"]
+
+
+def merge_archived(conn, table, sign=1):
+    """Add (``sign=-1``: take away) raw archived rows' totals."""
+
+    df = table.select(ARCHIVED_COLUMNS).to_pandas().dropna(subset=["date"])
+
+    df["email"] = df["email"].fillna("")
+    df["category"] = df["category"].fillna("")
+    df["amount"] = df["amount"].fillna(0)
+
+    days = df.groupby(["email", "date", "category"])["amount"].agg(["sum", "size"])
+
+    conn.executemany("""
+        INSERT INTO daily_totals (email, day, category, amount, row_count)
+        VALUES (?,?,?,?,?)
+        ON CONFLICT (email, day, category) DO UPDATE SET
+            amount = amount + excluded.amount,
+            row_count = row_count + excluded.row_count
+    """, [
+        (e, int(d), c, sign * int(total), sign * int(n))
+        for (e, d, c), total, n in zip(days.index, days["sum"], days["size"])
+    ])
+
+    if sign < 0:
+        conn.executemany(
+            "DELETE FROM daily_totals WHERE email = ? AND row_count <= 0",
+            [(e,) for e in df["email"].unique()]
+        )
+
+
+# -----------------------------------------
+# PREFIX SUMS (IN MEMORY)
+# -----------------------------------------
+# Per user, a dense day x category matrix of running totals from the
+# first to the last day with spend. Built from daily_totals once per data
+# version; any range total is then cum[end] - cum[start] per category.
+
+@user_cached
+def prefix_index(email):
+
+    with get_connection(email) as conn:
+
+        rows = conn.execute("""
+            SELECT day, category, amount, row_count
+            FROM daily_totals
+            WHERE email = ?
+        """, (email,)).fetchall()
+
+    if not rows:
+        return None
+
+    day, category, amount, count = (np.array(c) for c in zip(*rows))
+
+    categories, column = np.unique(category, return_inverse=True)
+
+    first = int(day.min())
+    span = int(day.max()) - first + 1
+
+    # Row 0 is "before the first day", so range sums need no special case
+    spend = np.zeros((span + 1, len(categories)), dtype=np.int64)
+    np.add.at(spend, (day - first + 1, column), amount.astype(np.int64))
+
+    counts = np.zeros(span + 1, dtype=np.int64)
+    np.add.at(counts, day - first + 1, count.astype(np.int64))
+
+    return {
+        "first": first,
+        "categories": categories.tolist(),
+        "spend": spend.cumsum(axis=0),
+        "count": counts.cumsum()
+    }
+
+
+def _row(index, day):
+
+    # Running-total row covering everything up to and including ``day``
+    return int(np.clip(day - index["first"] + 1, 0, len(index["count"]) - 1))
+
+
+def range_totals(email, start, end):
+    """Spend per category and row count for ``start``..``end`` (inclusive).
+
+    Two lookups into the cached running totals; no expense rows read.
+    Returns ``(Series of rupees by category, rows)``.
+    """
+
+    index = prefix_index(email)
+
+    if index is None or start > end:
+        return pd.Series(dtype=float), 0
+
+    lo = _row(index, to_epoch_day(start) - 1)
+    hi = _row(index, to_epoch_day(end))
+
+    spend = pd.Series(
+        (index["spend"][hi] - index["spend"][lo]) / 100,
+        index=index["categories"]
+    )
+
+    spend = spend[spend != 0].sort_values(ascending=False)
+
+    return spend, int(index["count"][hi] - index["count"][lo])
+
+
+# -----------------------------------------
+# CLI: python daily_index.py [email]
+# -----------------------------------------
+
+if __name__ == "__main__":
+
+    target = sys.argv[1] if len(sys.argv) > 1 else None
+
+    def rebuild(path):
+
+        with transaction(path) as conn:
+            backfill_daily_totals(conn, target)
+
+    shards.fan_out(rebuild)
+
+    print(f"Daily totals rebuilt for {target or 'all users'}")
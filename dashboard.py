@@ -1,110 +1,76 @@
 import pandas as pd
 import plotly.express as px
 import streamlit as st
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
-from utils import map_to_bucket, get_bucket_categories
+from budget_engine import analyze, overspent_buckets
+from daily_index import range_totals
+from downsample import downsample
+from forecast import forecast_user
 import matplotlib.pyplot as plt
-from expense_db import get_connection
+from expense_service import ALL_COLUMNS, month_range, query_expenses
+from frame_cache import user_cached
+from rollup import get_month_counts, get_month_rollup
 
 
 # ---------------------------------
 # GET AVAILABLE MONTHS (SAFE)
 # ---------------------------------
 
-def get_month_list(df):
+def get_month_list(email):
 
-    # Safety check
-    if df.empty or "date" not in df.columns:
-        return []
-
-    if not pd.api.types.is_datetime64_any_dtype(df["date"]):
-        return []
-
-    df = df.copy()
-
-    df["year_month"] = df["date"].dt.strftime("%Y-%m")
-
-    months = sorted(
-        df["year_month"].dropna().unique(),
-        reverse=True
-    )
-
-    return months
+    # {year_month: rows}, newest first, straight from the monthly
+    # rollup: no expense rows are loaded
+    return get_month_counts(email)
 
 
 # ---------------------------------
 # LOAD USER EXPENSES (SAFE)
 # ---------------------------------
 
-def load_expenses(email):
+def load_expenses(email, columns=ALL_COLUMNS, **filters):
 
-    conn = get_connection()
+    df = query_expenses(email, columns, **filters)
 
-    df = pd.read_sql_query(
-        """
-        SELECT *
-        FROM expenses
-        WHERE email=?
-        """,
-        conn,
-        params=(email,)
-    )
 
-    conn.close()
+    # Remove rows whose date could not be migrated
+    if df["date"].isna().any():
+        df = df.dropna(subset=["date"])
 
 
-    # No data
-    if df.empty:
-        return df
+    return df
 
 
-    # Missing column
-    if "date" not in df.columns:
-        return pd.DataFrame()
+# ---------------------------------
+# MONTHLY SUMMARY (FROM ROLLUP)
+# ---------------------------------
 
+def monthly_summary(rollup, salary):
 
-    # Safe datetime convert
-    df["date"] = pd.to_datetime(
-        df["date"],
-        errors="coerce"
-    )
+    if rollup.empty:
+        return 0, salary, salary, 0
 
+    expense = rollup["amount"].sum()
+    income = salary + rollup["other_income"].sum()
 
-    # Remove bad dates
-    df = df.dropna(subset=["date"])
+    savings = income - expense
 
+    percent = (savings / income * 100) if income else 0
 
-    return df
+    return expense, income, savings, percent
 
 
 # ---------------------------------
-# MONTHLY SUMMARY (SAFE)
+# ROWS OF ONE MONTH
 # ---------------------------------
 
-def monthly_summary(df, salary, selected_month):
-
-    if df.empty:
-        return 0, salary, salary, 0, df
+def month_rows(email, selected_month, columns=("date", "amount")):
 
     year, month = selected_month.split("-")
 
-    year = int(year)
-    month = int(month)
+    start, end = month_range(int(year), int(month))
 
-    df_m = df[
-        (df["date"].dt.year == year) &
-        (df["date"].dt.month == month)
-    ]
-
-    expense = df_m["amount"].sum()
-    income = salary + df_m["other_income"].sum()
-
-    savings = income - expense
-
-    percent = (savings / income * 100) if income else 0
-
-    return expense, income, savings, percent, df_m
+    return load_expenses(email, columns, start=start, end=end)
 
 
 # ---------------------------------
@@ -130,12 +96,20 @@ def category_pie(df):
 # DAILY TREND
 # ---------------------------------
 
-def daily_trend(df):
+# Width of a half-page chart; long ranges are thinned to what it shows
+TREND_WIDTH = 700
+
+
+def daily_trend(df, width=TREND_WIDTH, max_points=None):
 
     if df.empty:
         return None
 
-    daily = df.groupby("date")["amount"].sum().reset_index()
+    daily = downsample(
+        df.groupby("date")["amount"].sum(),
+        width=width,
+        max_points=max_points
+    ).reset_index()
 
     fig = px.line(
         daily,
@@ -177,92 +151,153 @@ def salary_vs_expense(income, expense):
 
 def budget_analysis(df, budget_map, income):
 
-    if df.empty:
-        return pd.DataFrame(
-            columns=[
-                "Bucket",
-                "Categories",
-                "Limit",
-                "Spent",
-                "Status"
-            ]
-        )
+    # Bucket mapping, totals and statuses in one vectorized pass
+    return analyze(df, budget_map, income)
 
-    df = df.copy()
 
-    df["final_bucket"] = df["category"].apply(map_to_bucket)
+# ---------------------------------
+# INSIGHTS ENGINE
+# ---------------------------------
 
-    bucket_categories = get_bucket_categories()
+def generate_insights(budget_df, savings_percent, forecast=None, income=0):
 
-    result = []
+    insights = []
 
-    for bucket, percent in budget_map.items():
+    if budget_df.empty:
+        return ["ℹ️ No data for insights"]
 
-        limit = income * percent / 100
+    for bucket in overspent_buckets(budget_df):
+        insights.append(f"⚠️ {bucket} exceeded limit")
 
-        spent = df[
-            df["final_bucket"] == bucket
-        ]["amount"].sum()
+    if savings_percent < 10:
+        insights.append("⚠️ Savings below 10%")
 
-        status = "OK🟢"
+    if savings_percent >= 20:
+        insights.append("✅ Good savings habit")
 
-        if spent > limit:
-            status = "Overspent🔴"
+    if not insights:
+        insights.append("🎯 Good financial health")
 
-        cats = bucket_categories.get(bucket, [])
+    # Projections (current month only)
+    if forecast is not None and not forecast.empty:
 
-        cat_text = ", ".join(cats) if cats else "-"
+        month_end = forecast["month_end"].sum()
 
-        result.append(
-            (
-                bucket,
-                cat_text,
-                round(limit, 2),
-                round(spent, 2),
-                status
+        insights.append(f"📈 Projected month-end spend: ₹{month_end:,.0f}")
+
+        if income and month_end > income:
+            insights.append(
+                f"⚠️ On pace to spend ₹{month_end - income:,.0f} more than income"
             )
+
+        top = forecast.loc[forecast["next_month"].idxmax()]
+
+        insights.append(
+            f"🔮 Next month: about ₹{forecast['next_month'].sum():,.0f}, "
+            f"most on {top['category'] or 'Uncategorized'}"
         )
 
-    return pd.DataFrame(
-        result,
-        columns=[
-            "Bucket",
-            "Categories",
-            "Limit",
-            "Spent",
-            "Status"
-        ]
-    )
+    return insights
 
 
 # ---------------------------------
-# INSIGHTS ENGINE
+# DASHBOARD VIEW (CACHED)
 # ---------------------------------
+# Everything the page shows for one month, built once per
+# (user, data version, month, salary, budget map, day). Reruns that
+# don't change any of those (widget clicks elsewhere, tab switches) reuse
+# the figures and tables; a write bumps the user's version and retires
+# them. The day is in the key because projections move with it.
 
-def generate_insights(budget_df, savings_percent):
+@user_cached
+def dashboard_view(email, selected_month, salary, budget_map, today):
 
-    insights = []
+    # Totals come from the trigger-maintained rollup: one row per
+    # category instead of the whole month
+    rollup = get_month_rollup(email, selected_month)
 
-    if budget_df.empty:
-        return ["ℹ️ No data for insights"]
+    exp, inc, sav, perc = monthly_summary(rollup, salary)
 
-    for _, row in budget_df.iterrows():
+    budget_df = budget_analysis(rollup, budget_map, inc)
 
-        if row["Status"] == "Overspent🔴":
-            insights.append(
-                f"⚠️ {row['Bucket']} exceeded limit"
-            )
+    forecast = None
 
-    if savings_percent < 10:
-        insights.append("⚠️ Savings below 10%")
+    if selected_month == today.strftime("%Y-%m"):
+        forecast = forecast_user(email, today)
 
-    if savings_percent >= 20:
-        insights.append("✅ Good savings habit")
+    return {
+        "summary": (exp, inc, sav, perc),
+        "pie": category_pie(rollup),
+        "trend": daily_trend(month_rows(email, selected_month)),
+        "income_vs_expense": salary_vs_expense(inc, exp),
+        "budget": budget_df,
+        "insights": generate_insights(budget_df, perc, forecast, inc)
+    }
 
-    if not insights:
-        insights.append("🎯 Good financial health")
 
-    return insights
+# ---------------------------------
+# ANY DATE RANGE (PREFIX SUMS)
+# ---------------------------------
+
+RANGE_PRESETS = {
+    "Last 7 days": 7,
+    "Last 30 days": 30,
+    "Last 45 days": 45,
+    "Last 90 days": 90,
+    "Last 365 days": 365,
+    "Custom": None
+}
+
+
+def show_range_totals(email):
+
+    st.subheader("📆 Any Date Range")
+
+    today = datetime.now().date()
+
+    preset = st.selectbox(
+        "Range",
+        list(RANGE_PRESETS),
+        index=1,
+        key="dash_range_preset"
+    )
+
+    days = RANGE_PRESETS[preset]
+
+    if days:
+        start, end = today - timedelta(days=days - 1), today
+
+    else:
+
+        picked = st.date_input(
+            "From - To",
+            value=(today - timedelta(days=29), today),
+            key="dash_range"
+        )
+
+        # The widget returns one date while the range is being picked
+        if len(picked) < 2:
+            return
+
+        start, end = picked
+
+    # Two lookups into the running daily totals, whatever the range
+    spend, rows = range_totals(email, start, end)
+
+    total = spend.sum()
+
+    r1, r2, r3 = st.columns(3)
+
+    r1.metric("Spent", f"₹{total:,.0f}")
+    r2.metric("Expenses", rows)
+    r3.metric("Per Day", f"₹{total / ((end - start).days + 1):,.0f}")
+
+    if not spend.empty:
+        st.dataframe(
+            spend.rename("Amount").rename_axis("Category").reset_index(),
+            use_container_width=True,
+            hide_index=True
+        )
 
 
 # ---------------------------------
@@ -271,22 +306,16 @@ def generate_insights(budget_df, savings_percent):
 
 def show_dashboard(user, budget_map):
 
-    df = load_expenses(user["email"])
+    # ---------------- Month Selector ----------------
 
+    counts = get_month_list(user["email"])
 
     # No expenses at all
-    if df.empty:
+    if not counts:
         st.info("📭 No expenses yet. Start adding some!")
         return
 
-
-    # ---------------- Month Selector ----------------
-
-    months = get_month_list(df)
-
-    if not months:
-        st.info("📅 No valid date data found")
-        return
+    months = list(counts)
 
 
     current = datetime.now().strftime("%Y-%m")
@@ -297,18 +326,23 @@ def show_dashboard(user, budget_map):
     selected_month = st.selectbox(
         "📅 Select Month",
         months,
-        index=default_index
+        index=default_index,
+        format_func=lambda m: f"{m}  ({counts[m]} expenses)"
     )
 
 
     # ---------------- Summary ----------------
 
-    exp, inc, sav, perc, df_m = monthly_summary(
-        df,
+    view = dashboard_view(
+        user["email"],
+        selected_month,
         user["salary"],
-        selected_month
+        budget_map,
+        datetime.now().date()
     )
 
+    exp, inc, sav, perc = view["summary"]
+
 
     c1, c2, c3, c4 = st.columns(4)
 
@@ -326,22 +360,18 @@ def show_dashboard(user, budget_map):
 
     with col1:
 
-        fig1 = category_pie(df_m)
-
-        if fig1:
-            st.plotly_chart(fig1, use_container_width=True)
+        if view["pie"]:
+            st.plotly_chart(view["pie"], use_container_width=True)
 
 
     with col2:
 
-        fig2 = daily_trend(df_m)
-
-        if fig2:
-            st.plotly_chart(fig2, use_container_width=True)
+        if view["trend"]:
+            st.plotly_chart(view["trend"], use_container_width=True)
 
 
     st.plotly_chart(
-        salary_vs_expense(inc, exp),
+        view["income_vs_expense"],
         use_container_width=True
     )
 
@@ -353,18 +383,20 @@ def show_dashboard(user, budget_map):
 
     st.subheader("📌 Budget vs Actual")
 
-    budget_df = budget_analysis(
-        df_m,
-        budget_map,
-        inc
-    )
-
-    st.dataframe(budget_df, use_container_width=True)
+    st.dataframe(view["budget"], use_container_width=True)
 
 
     # ---------------- Insights ----------------
 
     st.subheader("🤖 Smart Insights")
 
-    for i in generate_insights(budget_df, perc):
+    for i in view["insights"]:
         st.info(i)
+
+
+    st.divider()
+
+
+    # ---------------- Date Range ----------------
+
+    show_range_totals(user["email"])
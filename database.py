@@ -1,12 +1,13 @@
 import sqlite3
-from pathlib import Path
+
+import schema
 
 
 # -----------------------------------------
 # DATABASE PATH
 # -----------------------------------------
 
-DB_PATH = Path("data/users.db")
+DB_PATH = schema.DB_PATH
 
 
 # -----------------------------------------
@@ -14,7 +15,11 @@ DB_PATH = Path("data/users.db")
 # -----------------------------------------
 
 def get_connection():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+    return schema.get_connection()
+
+
+def get_transaction():
+    return schema.get_transaction()
 
 
 # -----------------------------------------
@@ -23,63 +28,8 @@ def get_connection():
 
 def init_db():
 
-    DB_PATH.parent.mkdir(exist_ok=True)
-
-    conn = get_connection()
-    cur = conn.cursor()
-
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-
-            phone TEXT,
-            dob TEXT,
-
-            salary REAL,
-
-            gender TEXT,
-            job TEXT,
-
-            address TEXT,
-
-            pic TEXT,
-            notify TEXT
-        )
-    """)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS expenses (
-
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-
-            email TEXT,
-            name TEXT,
-
-            date TEXT,
-
-            amount REAL,
-
-            category TEXT,
-            subcategory TEXT,
-
-            bucket TEXT,
-
-            spent_by TEXT,
-
-            payment_mode TEXT,
-
-            notes TEXT,
-
-            other_income REAL
-        )
-        """)
-
-
-    conn.commit()
-    conn.close()
+    # users and expenses share one file; see schema.py
+    schema.create_tables()
 
 
 # -----------------------------------------
@@ -88,44 +38,39 @@ def init_db():
 
 def insert_user(data: dict):
 
-    conn = get_connection()
-    cur = conn.cursor()
-
     try:
 
-        cur.execute("""
+        with get_transaction() as conn:
+
+            conn.execute("""
             INSERT INTO users
             (name,email,password,phone,dob,salary,
              gender,job,address,pic,notify)
 
             VALUES (?,?,?,?,?,?,?,?,?,?,?)
-        """, (
+            """, (
 
-            data["name"],
-            data["email"],
-            data["password"],
-            data["phone"],
-            data["dob"],
-            data["salary"],
+                data["name"],
+                data["email"],
+                data["password"],
+                data["phone"],
+                data["dob"],
+                data["salary"],
 
-            data["gender"],
-            data["job"],
-            data["address"],
+                data["gender"],
+                data["job"],
+                data["address"],
 
-            data.get("pic", ""),
-            data.get("notify", "21:00")
+                data.get("pic", ""),
+                data.get("notify", "21:00")
 
-        ))
+            ))
 
-        conn.commit()
         return True
 
     except sqlite3.IntegrityError:
         return False
 
-    finally:
-        conn.close()
-
 
 # -----------------------------------------
 # GET USER BY EMAIL
@@ -133,16 +78,12 @@ def insert_user(data: dict):
 
 def get_user_by_email(email):
 
-    conn = get_connection()
-    cur = conn.cursor()
-
-    cur.execute("""
-        SELECT * FROM users
-        WHERE email=?
-    """, (email,))
+    with get_connection() as conn:
 
-    row = cur.fetchone()
-    conn.close()
+        row = conn.execute("""
+            SELECT * FROM users
+            WHERE email=?
+        """, (email,)).fetchone()
 
     if not row:
         return None
@@ -165,37 +106,33 @@ def update_user_profile(
     address
 ):
 
-    conn = get_connection()
-    cur = conn.cursor()
+    with get_transaction() as conn:
 
-    cur.execute("""
-        UPDATE users
+        conn.execute("""
+            UPDATE users
 
-        SET
-            name=?,
-            phone=?,
-            dob=?,
-            salary=?,
-            gender=?,
-            job=?,
-            address=?
+            SET
+                name=?,
+                phone=?,
+                dob=?,
+                salary=?,
+                gender=?,
+                job=?,
+                address=?
 
-        WHERE email=?
-    """, (
-
-        name,
-        phone,
-        dob,
-        salary,
-        gender,
-        job,
-        address,
+            WHERE email=?
+        """, (
 
-        email
-    ))
+            name,
+            phone,
+            dob,
+            salary,
+            gender,
+            job,
+            address,
 
-    conn.commit()
-    conn.close()
+            email
+        ))
 
 
 # -----------------------------------------
@@ -204,17 +141,13 @@ def update_user_profile(
 
 def update_password(email, new_pass):
 
-    conn = get_connection()
-    cur = conn.cursor()
-
-    cur.execute("""
-        UPDATE users
-        SET password=?
-        WHERE email=?
-    """, (new_pass, email))
+    with get_transaction() as conn:
 
-    conn.commit()
-    conn.close()
+        conn.execute("""
+            UPDATE users
+            SET password=?
+            WHERE email=?
+        """, (new_pass, email))
 
 
 # -----------------------------------------
@@ -251,13 +184,10 @@ def format_user(row):
 
 def get_user_count():
 
-    conn = get_connection()
-    cur = conn.cursor()
-
-    cur.execute("SELECT COUNT(*) FROM users")
-
-    count = cur.fetchone()[0]
+    with get_connection() as conn:
 
-    conn.close()
+        count = conn.execute(
+            "SELECT COUNT(*) FROM users"
+        ).fetchone()[0]
 
     return count
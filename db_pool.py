@@ -0,0 +1,172 @@
+import atexit
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+
+# -----------------------------------------
+# SETTINGS
+# -----------------------------------------
+
+POOL_SIZE = 8
+
+BUSY_TIMEOUT_MS = 5000
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",        # ~16 MB page cache
+    "PRAGMA mmap_size=268435456",      # 256 MB
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+)
+
+
+# -----------------------------------------
+# CONNECTION POOL
+# -----------------------------------------
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of SQLite connections for one file.
+
+    Connections are opened lazily up to ``size``; once that many are
+    checked out, ``acquire`` blocks until one is returned.
+    """
+
+    def __init__(self, path, size=POOL_SIZE):
+
+        self.path = Path(path)
+        self.size = size
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def _open(self):
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False
+        )
+
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+
+        return conn
+
+    def acquire(self):
+
+        if self._closed:
+            raise RuntimeError(f"Pool for {self.path} is closed")
+
+        self._slots.acquire()
+
+        try:
+            return self._idle.get_nowait()
+
+        except queue.Empty:
+            pass
+
+        try:
+            return self._open()
+
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+
+        # Never hand out a connection with a half-finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+
+        if self._closed:
+            conn.close()
+
+        else:
+            self._idle.put(conn)
+
+        self._slots.release()
+
+    def close(self):
+
+        self._closed = True
+
+        while True:
+
+            try:
+                self._idle.get_nowait().close()
+
+            except queue.Empty:
+                break
+
+
+# -----------------------------------------
+# POOL REGISTRY
+# -----------------------------------------
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path):
+
+    key = Path(path).resolve()
+
+    with _pools_lock:
+
+        pool = _pools.get(key)
+
+        if pool is None:
+            pool = ConnectionPool(key)
+            _pools[key] = pool
+
+        return pool
+
+
+@atexit.register
+def close_all():
+
+    with _pools_lock:
+
+        for pool in _pools.values():
+            pool.close()
+
+        _pools.clear()
+
+
+# -----------------------------------------
+# BORROW HELPERS
+# -----------------------------------------
+
+@contextmanager
+def connection(path):
+    """Borrow a pooled connection; it is returned on exit."""
+
+    pool = get_pool(path)
+    conn = pool.acquire()
+
+    try:
+        yield conn
+
+    finally:
+        pool.release(conn)
+
+
+@contextmanager
+def transaction(path):
+    """Borrow a connection and commit on success, roll back on error."""
+
+    with connection(path) as conn:
+
+        try:
+            yield conn
+            conn.commit()
+
+        except Exception:
+            conn.rollback()
+            raise
@@ -0,0 +1,140 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# -----------------------------------------
+# SETTINGS
+# -----------------------------------------
+# A line chart can't show more points than it has pixels, so a long
+# daily series is thinned on the server before Plotly / matplotlib see
+# it. CHART_MAX_POINTS caps every chart; narrower charts get fewer.
+
+MAX_POINTS = int(os.environ.get("CHART_MAX_POINTS", "500"))
+
+PIXELS_PER_POINT = 2
+
+METHODS = ("minmax", "lttb")
+
+
+def target_points(span, width=None, max_points=None):
+    """Points worth drawing for ``span`` values on a ``width`` px chart."""
+
+    limit = max_points or MAX_POINTS
+
+    if width:
+        limit = min(limit, width // PIXELS_PER_POINT)
+
+    return max(4, min(span, limit))
+
+
+# -----------------------------------------
+# MIN / MAX BUCKETS
+# -----------------------------------------
+# Keeps the lowest and the highest value of every bucket, so no peak
+# is ever dropped. Fully vectorized.
+
+def minmax_indices(y, n):
+
+    size = len(y)
+
+    if size <= n:
+        return np.arange(size)
+
+    # First and last points are kept; the rest split into buckets that
+    # each give two points
+    buckets = max(1, (n - 2) // 2)
+
+    inner = np.arange(1, size - 1)
+    bucket = (inner - 1) * buckets // len(inner)
+
+    # Sorted by (bucket, value): a bucket's first entry is its min and
+    # its last entry its max
+    order = inner[np.lexsort((y[inner], bucket))]
+    ends = np.flatnonzero(np.diff(bucket[order - 1], append=buckets))
+
+    starts = np.concatenate(([0], ends[:-1] + 1))
+
+    return np.unique(np.concatenate(([0], order[starts], order[ends], [size - 1])))
+
+
+# -----------------------------------------
+# LARGEST TRIANGLE THREE BUCKETS
+# -----------------------------------------
+# Picks, per bucket, the point forming the largest triangle with the
+# previous pick and the next bucket's average: keeps the visual shape
+# (including spikes) with exactly n points.
+
+def lttb_indices(x, y, n):
+
+    size = len(y)
+
+    if size <= n:
+        return np.arange(size)
+
+    edges = np.linspace(1, size - 1, n - 1).astype(int)
+
+    keep = np.empty(n, dtype=int)
+    keep[0], keep[-1] = 0, size - 1
+
+    a = 0
+
+    for i in range(n - 2):
+
+        lo, hi = edges[i], edges[i + 1]
+
+        # Average of the next bucket (the last point for the final one)
+        nhi = edges[i + 2] if i + 2 < len(edges) else size
+
+        nx = x[hi:nhi].mean()
+        ny = y[hi:nhi].mean()
+
+        area = np.abs(
+            (x[a] - nx) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (ny - y[a])
+        )
+
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+
+    return keep
+
+
+# -----------------------------------------
+# SERIES
+# -----------------------------------------
+
+def _positions(index):
+
+    if pd.api.types.is_numeric_dtype(index):
+        return index.to_numpy(dtype=float)
+
+    return pd.to_datetime(index).asi8.astype(float)
+
+
+def downsample(series, width=None, max_points=None, method="minmax"):
+    """Thin a date-indexed series to what a ``width`` px chart can show.
+
+    Short series come back unchanged. ``minmax`` keeps every bucket's
+    extremes (no spike is lost), ``lttb`` keeps the overall shape.
+    """
+
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}")
+
+    series = series.sort_index()
+
+    n = target_points(len(series), width, max_points)
+
+    if len(series) <= n:
+        return series
+
+    y = series.to_numpy(dtype=float)
+
+    if method == "minmax":
+        keep = minmax_indices(y, n)
+    else:
+        keep = lttb_indices(_positions(series.index), y, n)
+
+    return series.iloc[keep]
@@ -1,45 +1,115 @@
-import sqlite3
-import os
+import hashlib
+import re
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
 
+import pandas as pd
 
-DB_PATH = "data/expenses.db"
+import schema
+import shards
+from db_pool import connection, transaction
 
 
-def get_connection():
+DB_PATH = schema.DB_PATH
 
-    os.makedirs("data", exist_ok=True)
 
-    return sqlite3.connect(DB_PATH)
+# -----------------------------------------
+# STORAGE CODEC
+# -----------------------------------------
+# Dates are stored as days since 1970-01-01 and money as integer paise.
+# Convert only here, at the boundary, never per query.
 
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
 
-def create_expense_table():
 
-    conn = get_connection()
-    cur = conn.cursor()
+def to_epoch_day(value):
+
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+def from_epoch_day(day):
+
+    return date.fromordinal(int(day) + EPOCH_ORDINAL)
+
+
+def to_paise(amount):
+
+    paise = Decimal(str(amount or 0)) * 100
+
+    return int(paise.quantize(Decimal(1), ROUND_HALF_UP))
+
+
+def from_paise(paise):
+
+    return (paise or 0) / 100
+
+
+def decode_expenses(df):
+    """Turn stored columns of a result frame back into dates and rupees."""
+
+    if "date" in df.columns:
+        df["date"] = pd.to_datetime(df["date"], unit="D")
 
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS expenses (
+    for col in ("amount", "other_income"):
 
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        if col in df.columns:
+            df[col] = df[col] / 100
 
-        name TEXT,
-        date TEXT,
-        amount REAL,
+    return df
 
-        category TEXT,
-        subcategory TEXT,
-        bucket TEXT,
 
-        spent_by TEXT,
-        payment_mode TEXT,
+# -----------------------------------------
+# DUPLICATE FINGERPRINT
+# -----------------------------------------
+# Built from stored values (epoch day, paise) so the same expense gives
+# the same key whether it came from the form, an import or a backfill.
 
-        notes TEXT,
+def normalize_note(notes):
 
-        other_income REAL DEFAULT 0,
+    if notes is None or notes != notes:   # None / NaN
+        return ""
 
-        email TEXT
-    )
-    """)
+    return " ".join(re.findall(r"\w+", str(notes).lower()))
+
+
+def fingerprint(email, day, paise, category, subcategory, notes):
+
+    key = "|".join([
+        (email or "").strip().lower(),
+        str(day),
+        str(paise),
+        (category or "").strip().lower(),
+        (subcategory or "").strip().lower(),
+        normalize_note(notes)
+    ])
+
+    return hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+
+
+def get_connection(email=None):
+    """Connection to the file holding ``email``'s expenses.
+
+    Without an email (or unsharded) this is the main database; jobs that
+    touch every user go through ``shards.fan_out`` instead.
+    """
+
+    if email is None:
+        return schema.get_connection()
+
+    return connection(shards.db_path(email))
+
+
+def get_transaction(email=None):
+
+    if email is None:
+        return schema.get_transaction()
+
+    return transaction(shards.db_path(email))
+
+
+def create_expense_table():
 
-    conn.commit()
-    conn.close()
+    schema.create_tables()
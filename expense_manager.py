@@ -1,3 +1,6 @@
+import csv
+import os
+import threading
 import pandas as pd
 from pathlib import Path
 from datetime import datetime
@@ -10,6 +13,43 @@ from datetime import datetime
 DATA_PATH = Path("data/expenses.csv")
 
 
+# ---------------------------------
+# LOG FORMAT
+# ---------------------------------
+# The CSV is an append-only log: every add is one line with a stable
+# row_id, a delete appends a tombstone ("del") for that row_id, and
+# compaction rewrites the file without dead rows. row_ids are never
+# reused: next_id is one past the largest row_id in the log, and
+# compaction keeps the tombstone of the largest id if that row died.
+
+EXPENSE_COLUMNS = [
+                    "email",
+                    "name",
+                    "date",
+                    "amount",
+                    "category",
+                    "subcategory",
+                    "bucket",
+                    "spent_by",
+                    "payment_mode",
+                    "notes",
+                    "other_income"
+                ]
+
+LOG_COLUMNS = ["row_id", "op"] + EXPENSE_COLUMNS
+
+CHUNK_SIZE = 50_000
+
+# Compact once tombstones reach this many and a quarter of the log
+COMPACT_MIN_DEAD = 1_000
+COMPACT_RATIO = 0.25
+
+_lock = threading.Lock()
+
+# next_id / rows / dead as of a log of `size` bytes
+_state = {}
+
+
 # ---------------------------------
 # INIT FILE
 # ---------------------------------
@@ -20,23 +60,114 @@ def init_expense_file():
 
     if not DATA_PATH.exists():
 
-        df = pd.DataFrame(columns=[
-                                    "email",
-                                    "name",
-                                    "date",
-                                    "amount",
-                                    "category",
-                                    "subcategory",
-                                    "bucket",
-                                    "spent_by",
-                                    "payment_mode",
-                                    "notes",
-                                    "other_income"
-                                ])
-
+        df = pd.DataFrame(columns=LOG_COLUMNS)
 
         df.to_csv(DATA_PATH, index=False)
 
+    elif _header() != LOG_COLUMNS:
+
+        convert_legacy_file()
+
+
+def _header():
+
+    with open(DATA_PATH, newline="") as f:
+        return next(csv.reader(f), [])
+
+
+def _chunks(usecols=None, chunksize=CHUNK_SIZE):
+
+    return pd.read_csv(
+        DATA_PATH,
+        usecols=usecols,
+        chunksize=chunksize,
+        dtype={"row_id": "int64"}
+    )
+
+
+def _replace(tmp):
+
+    os.replace(tmp, DATA_PATH)
+    _state.clear()
+
+
+def convert_legacy_file():
+    """One-time upgrade of a plain expenses CSV to the log format.
+
+    row_id is the row's old position, the same index the old
+    ``delete_expense`` took.
+    """
+
+    tmp = DATA_PATH.with_suffix(".csv.tmp")
+
+    with _lock:
+
+        position = 0
+        header = True
+
+        for chunk in pd.read_csv(DATA_PATH, chunksize=CHUNK_SIZE):
+
+            chunk = chunk.reindex(columns=EXPENSE_COLUMNS)
+
+            chunk.insert(0, "row_id", range(position, position + len(chunk)))
+            chunk.insert(1, "op", "add")
+
+            chunk.to_csv(tmp, index=False, header=header, mode="w" if header else "a")
+
+            position += len(chunk)
+            header = False
+
+        if header:
+            pd.DataFrame(columns=LOG_COLUMNS).to_csv(tmp, index=False)
+
+        _replace(tmp)
+
+
+# ---------------------------------
+# LOG STATE
+# ---------------------------------
+
+def _log_state():
+    """Counters for the log, rescanned only if the file changed under us."""
+
+    size = DATA_PATH.stat().st_size
+
+    if _state.get("size") != size:
+
+        next_id, rows, dead = 0, 0, 0
+
+        for chunk in _chunks(usecols=["row_id", "op"]):
+
+            adds = chunk["op"] == "add"
+
+            if len(chunk):
+                next_id = max(next_id, int(chunk["row_id"].max()) + 1)
+
+            rows += int(adds.sum())
+            dead += int((~adds).sum())
+
+        _state.update(size=size, next_id=next_id, rows=rows, dead=dead)
+
+    return _state
+
+
+def _append(line):
+
+    with open(DATA_PATH, "a", newline="") as f:
+        csv.writer(f).writerow(line)
+
+    _state["size"] = DATA_PATH.stat().st_size
+
+
+def _tombstones(chunksize=CHUNK_SIZE):
+
+    dead = set()
+
+    for chunk in _chunks(["row_id", "op"], chunksize):
+        dead.update(chunk.loc[chunk["op"] == "del", "row_id"].tolist())
+
+    return dead
+
 
 # ---------------------------------
 # ADD EXPENSE
@@ -46,11 +177,20 @@ def add_expense(data: dict):
 
     init_expense_file()
 
-    df = pd.read_csv(DATA_PATH)
+    with _lock:
+
+        state = _log_state()
+
+        row_id = state["next_id"]
 
-    df = pd.concat([df, pd.DataFrame([data])])
+        _append(
+            [row_id, "add"] + [data.get(c, "") for c in EXPENSE_COLUMNS]
+        )
 
-    df.to_csv(DATA_PATH, index=False)
+        state["next_id"] += 1
+        state["rows"] += 1
+
+    return row_id
 
 
 # ---------------------------------
@@ -58,12 +198,26 @@ def add_expense(data: dict):
 # ---------------------------------
 
 def get_user_expenses(email):
+    """Live rows of a user, indexed by row_id."""
 
     init_expense_file()
 
-    df = pd.read_csv(DATA_PATH)
+    dead = set()
+    parts = []
+
+    for chunk in _chunks():
+
+        tomb = chunk["op"] == "del"
 
-    return df[df["email"] == email]
+        dead.update(chunk.loc[tomb, "row_id"].tolist())
+
+        parts.append(chunk[~tomb & (chunk["email"] == email)])
+
+    df = pd.concat(parts) if parts else pd.DataFrame(columns=LOG_COLUMNS)
+
+    df = df[~df["row_id"].isin(dead)]
+
+    return df.set_index("row_id")[EXPENSE_COLUMNS]
 
 
 # ---------------------------------
@@ -72,8 +226,135 @@ def get_user_expenses(email):
 
 def delete_expense(index):
 
-    df = pd.read_csv(DATA_PATH)
+    init_expense_file()
+
+    with _lock:
+
+        state = _log_state()
+
+        _append([int(index), "del"] + [""] * len(EXPENSE_COLUMNS))
+
+        state["dead"] += 1
+
+        due = (
+            state["dead"] >= COMPACT_MIN_DEAD
+            and state["dead"] >= COMPACT_RATIO * state["rows"]
+        )
+
+    if due:
+        compact()
+
+
+# ---------------------------------
+# COMPACTION
+# ---------------------------------
+
+def compact():
+    """Rewrite the log without deleted rows or tombstones."""
+
+    init_expense_file()
+
+    tmp = DATA_PATH.with_suffix(".csv.tmp")
+
+    with _lock:
+
+        dead = _tombstones()
+
+        header = True
+        top = kept = -1
+
+        for chunk in _chunks():
+
+            keep = chunk[(chunk["op"] == "add") & ~chunk["row_id"].isin(dead)]
+
+            keep.to_csv(tmp, index=False, header=header, mode="w" if header else "a")
+
+            if len(chunk):
+                top = max(top, int(chunk["row_id"].max()))
+
+            if len(keep):
+                kept = max(kept, int(keep["row_id"].max()))
+
+            header = False
+
+        if header:
+            pd.DataFrame(columns=LOG_COLUMNS).to_csv(tmp, index=False)
+
+        # High-water mark: without it the deleted tail's ids would be
+        # handed out again, and a stale delete_expense(id) would hit
+        # the new row
+        if top > kept:
+
+            with open(tmp, "a", newline="") as f:
+                csv.writer(f).writerow([top, "del"] + [""] * len(EXPENSE_COLUMNS))
+
+        _replace(tmp)
+
+
+# ---------------------------------
+# MIGRATE TO SQLITE
+# ---------------------------------
+
+def migrate_csv_to_sqlite(chunk_size=CHUNK_SIZE):
+    """Stream the CSV store into the SQLite ``expenses`` table.
+
+    Reads ``chunk_size`` rows at a time and writes each chunk with
+    ``add_expenses_bulk``. The CSV is renamed to ``*.migrated`` at the
+    end so a second run does nothing. Returns migrated/failed counts.
+    """
+
+    from expense_service import add_expenses_bulk
+
+    if not DATA_PATH.exists():
+        return {"migrated": 0, "failed": 0}
+
+    init_expense_file()
+
+    # Pass 1: tombstones only, so pass 2 can skip deleted rows
+    dead = _tombstones(chunk_size)
+
+    migrated = failed = 0
+
+    for chunk in _chunks(chunksize=chunk_size):
+
+        live = chunk[(chunk["op"] == "add") & ~chunk["row_id"].isin(dead)]
+
+        # The CSV never rejected repeats, so identical rows are real
+        # (two teas on one day); keep them, flagged for review
+        outcomes = add_expenses_bulk(
+            live[EXPENSE_COLUMNS].to_dict("records"), on_duplicate="flag"
+        )
+
+        ok = sum(o["ok"] for o in outcomes)
+
+        migrated += ok
+        failed += len(outcomes) - ok
+
+    stamp = datetime.now().strftime("%Y%m%d%H%M%S")
+
+    os.replace(DATA_PATH, DATA_PATH.with_suffix(f".csv.{stamp}.migrated"))
+
+    _state.clear()
+
+    return {"migrated": migrated, "failed": failed}
+
+
+# ---------------------------------
+# CLI: python expense_manager.py [migrate|compact]
+# ---------------------------------
+
+if __name__ == "__main__":
+
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "migrate"
+
+    if command == "compact":
+        compact()
+        print("Compacted", DATA_PATH)
 
-    df = df.drop(index)
+    else:
+        from migrations import run_migrations
 
-    df.to_csv(DATA_PATH, index=False)
+        run_migrations()
+        print(migrate_csv_to_sqlite())
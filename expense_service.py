@@ -1,34 +1,81 @@
-from expense_db import get_connection
-import pandas as pd
+import json
+import sqlite3
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import daily_index
+import rollup
+from archive import read_archive, remove_archived
+from arrow_reader import EXPENSE_TYPES, decode_table, fetch_arrow, to_frame
+from expense_db import (
+    fingerprint,
+    get_connection,
+    get_transaction,
+    to_epoch_day,
+    to_paise
+)
+import shards
+import write_behind
+from frame_cache import bump_version, user_cached
 
 
 # --------------------------------
-# ADD EXPENSE
+# ROW -> INSERT PARAMS
 # --------------------------------
 
-def add_expense(data):
+BULK_CHUNK_SIZE = 500
 
-    conn = get_connection()
-    cur = conn.cursor()
+INSERT_SQL = f"""
+INSERT INTO expenses (
 
-    cur.execute("""
-    INSERT INTO expenses (
+    id,
 
-        name, date, amount,
+    name, date, amount,
 
-        category, subcategory, bucket,
+    category, subcategory, bucket,
 
-        spent_by, payment_mode,
+    spent_by, payment_mode,
 
-        notes, other_income, email
-    )
+    notes, other_income, email,
+
+    fingerprint, duplicate_of
+)
+
+VALUES ({shards.next_id_sql("expenses")}, ?,?,?,?,?,?,?,?,?,?,?,?,?)
+"""
+
+# Positions in the expense_params tuple
+_EMAIL, _FINGERPRINT, _DUPLICATE_OF = 10, 11, 12
+
+
+def _text(value):
+
+    if value is None or value != value:   # None / NaN
+        return ""
+
+    return str(value)
+
+
+def _number(value):
+
+    if value is None or value == "" or value != value:
+        return 0.0
+
+    return float(value)
+
+
+def expense_params(data, duplicate_of=None):
+
+    day = to_epoch_day(data["date"])
+    paise = to_paise(data["amount"])
 
-    VALUES (?,?,?,?,?,?,?,?,?,?,?)
-    """, (
+    return (
 
         data["name"],
-        data["date"],
-        float(data["amount"]),
+        day,
+        paise,
 
         data["category"],
         data["subcategory"],
@@ -38,52 +85,553 @@ def add_expense(data):
         data["payment_mode"],
 
         data["notes"],
-        float(data["other_income"]),
+        to_paise(data["other_income"]),
+
+        data["email"],
+
+        fingerprint(
+            data["email"], day, paise,
+            data["category"], data["subcategory"], data["notes"]
+        ),
+        duplicate_of
+    )
+
+
+def validate_expense(data):
+    """Normalise one imported row; raises ValueError when unusable."""
+
+    if not _text(data.get("email")):
+        raise ValueError("email is required")
+
+    if not _text(data.get("category")):
+        raise ValueError("category is required")
+
+    try:
+        exp_date = date.fromisoformat(_text(data.get("date"))[:10])
+    except ValueError:
+        raise ValueError(f"invalid date {data.get('date')!r}")
+
+    if not _text(data.get("amount")):
+        raise ValueError("amount is required")
+
+    try:
+        amount = _number(data.get("amount"))
+        other_income = _number(data.get("other_income"))
+    except (TypeError, ValueError):
+        raise ValueError("amount must be a number")
+
+    if amount < 0 or other_income < 0:
+        raise ValueError("amount cannot be negative")
+
+    return {
+
+        "email": _text(data["email"]),
+        "name": _text(data.get("name")),
+        "date": exp_date.isoformat(),
+        "amount": amount,
+
+        "category": _text(data["category"]),
+        "subcategory": _text(data.get("subcategory")),
+        "bucket": _text(data.get("bucket")),
+
+        "spent_by": _text(data.get("spent_by")),
+        "payment_mode": _text(data.get("payment_mode")),
+
+        "notes": _text(data.get("notes")),
+        "other_income": other_income
+    }
+
+
+# --------------------------------
+# DUPLICATES
+# --------------------------------
+# A row whose fingerprint is already stored (or appears earlier in the
+# same batch) is a likely duplicate. on_duplicate decides what happens:
+#   reject - not inserted, reported as an error
+#   merge  - not inserted; blanks in the existing row are filled in
+#            (an archived original is left as it is)
+#   flag   - inserted with duplicate_of set, for review
+
+DUPLICATE_MODES = ("reject", "merge", "flag")
+
+MERGE_SQL = """
+UPDATE expenses SET
+
+    name = COALESCE(NULLIF(name, ''), ?),
+    bucket = COALESCE(NULLIF(bucket, ''), ?),
+
+    spent_by = COALESCE(NULLIF(spent_by, ''), ?),
+    payment_mode = COALESCE(NULLIF(payment_mode, ''), ?),
+
+    notes = COALESCE(NULLIF(notes, ''), ?)
+
+WHERE id = ?
+"""
+
+
+class DuplicateExpenseError(ValueError):
+
+    def __init__(self, existing_id):
+
+        super().__init__(f"duplicate of expense {existing_id}")
+
+        self.existing_id = existing_id
+
+
+def _first_ids(conn, fingerprints):
+    """fingerprint -> oldest stored id, live or archived; one index
+    probe per fingerprint and table."""
+
+    return dict(conn.execute("""
+        SELECT fingerprint, MIN(id)
+        FROM (
+            SELECT fingerprint, id FROM expenses
+            WHERE fingerprint IN (SELECT value FROM json_each(?1))
+            UNION ALL
+            SELECT fingerprint, id FROM archived_fingerprints
+            WHERE fingerprint IN (SELECT value FROM json_each(?1))
+        )
+        GROUP BY fingerprint
+    """, (json.dumps(list(fingerprints)),)))
+
+
+def _resolve_duplicates(conn, dupes, outcomes, on_duplicate):
+
+    originals = _first_ids(conn, {p[_FINGERPRINT] for _, p in dupes})
+
+    for i, params in dupes:
+
+        original = originals.get(params[_FINGERPRINT])
+
+        outcomes[i]["duplicate_of"] = original
+
+        if original is None:
+            # The row it repeated failed to insert; try it on its own
+            _insert_one(conn, i, params, outcomes)
+
+        elif on_duplicate == "reject":
+            outcomes[i].update(ok=False, error=f"duplicate of expense {original}")
+
+        elif on_duplicate == "merge":
+            conn.execute(MERGE_SQL, (
+                params[0], params[5], params[6], params[7], params[8], original
+            ))
+
+        else:
+            _insert_one(
+                conn, i, params[:_DUPLICATE_OF] + (original,), outcomes
+            )
+
+
+def _insert_one(conn, i, params, outcomes):
 
-        data["email"]
-    ))
+    try:
+        conn.execute(INSERT_SQL, params)
 
-    conn.commit()
-    conn.close()
+    except sqlite3.IntegrityError as e:
+        outcomes[i].update(ok=False, error=str(e))
+
+
+# --------------------------------
+# ADD EXPENSE
+# --------------------------------
+
+def add_expense(data, on_duplicate="reject"):
+    """Insert one expense and return its ``add_expenses_bulk`` outcome.
+
+    Raises ``DuplicateExpenseError`` when the row repeats a stored one
+    and ``on_duplicate`` is "reject". With write-behind enabled the row
+    is queued instead and a Future resolving to its outcome is
+    returned; pass that outcome to ``check_outcome`` for the same
+    errors.
+    """
+
+    if write_behind.ENABLED:
+        return write_behind.get_queue(add_expenses_bulk).submit(
+            data, on_duplicate=on_duplicate
+        )
+
+    return check_outcome(
+        add_expenses_bulk([data], on_duplicate=on_duplicate)[0]
+    )
+
+
+def check_outcome(outcome):
+    """Return a successful outcome; raise ``DuplicateExpenseError`` or
+    ``ValueError`` for a failed one."""
+
+    if not outcome["ok"]:
+
+        if outcome["duplicate_of"] is not None:
+            raise DuplicateExpenseError(outcome["duplicate_of"])
+
+        raise ValueError(outcome["error"])
+
+    return outcome
+
+
+# --------------------------------
+# ADD EXPENSES (BULK)
+# --------------------------------
+
+def add_expenses_bulk(rows, chunk_size=BULK_CHUNK_SIZE, on_duplicate="reject"):
+    """Validate and insert many rows in one transaction.
+
+    Returns one ``{"row", "ok", "error", "duplicate_of"}`` dict per input
+    row, in order. See DUPLICATE_MODES for ``on_duplicate``.
+    """
+
+    # One transaction per expense file (just one unless sharded)
+    groups = {}
+
+    for i, row in enumerate(rows):
+
+        email = _text(row.get("email")) or None
+
+        groups.setdefault(shards.db_path(email), (email, []))[1].append(i)
+
+    outcomes = [None] * len(rows)
+    written = set()
+
+    for email, index in groups.values():
+
+        with get_transaction(email) as conn:
+
+            conn.execute("BEGIN")
+
+            part, emails = write_expenses(
+                conn, [rows[i] for i in index], chunk_size, on_duplicate
+            )
+
+        for i, outcome in zip(index, part):
+            outcomes[i] = dict(outcome, row=i)
+
+        written |= emails
+
+    for email in written:
+        bump_version(email)
+
+    return outcomes
+
+
+def write_expenses(conn, rows, chunk_size=BULK_CHUNK_SIZE, on_duplicate="reject"):
+    """The body of ``add_expenses_bulk`` inside the caller's transaction.
+
+    Every row must belong on ``conn``'s file (see ``shards.db_path``).
+
+    Returns ``(outcomes, emails)``; the caller commits, then bumps the
+    cache version of each email written.
+    """
+
+    if on_duplicate not in DUPLICATE_MODES:
+        raise ValueError(f"on_duplicate must be one of {DUPLICATE_MODES}")
+
+    outcomes = []
+    pending = []
+
+    for i, row in enumerate(rows):
+
+        outcome = {"row": i, "ok": True, "error": None, "duplicate_of": None}
+
+        try:
+            pending.append((i, expense_params(validate_expense(row))))
+
+        except ValueError as e:
+            outcome.update(ok=False, error=str(e))
+
+        outcomes.append(outcome)
+
+    for start in range(0, len(pending), chunk_size):
+
+        chunk = pending[start:start + chunk_size]
+
+        conn.execute("SAVEPOINT bulk_chunk")
+
+        stored = _first_ids(conn, {p[_FINGERPRINT] for _, p in chunk})
+
+        fresh, dupes, seen = [], [], set()
+
+        for i, params in chunk:
+
+            fp = params[_FINGERPRINT]
+
+            if fp in stored or fp in seen:
+                dupes.append((i, params))
+
+            else:
+                seen.add(fp)
+                fresh.append((i, params))
+
+        try:
+            conn.executemany(INSERT_SQL, [p for _, p in fresh])
+
+        except sqlite3.IntegrityError:
+
+            # Replay the chunk row by row to find the offenders
+            conn.execute("ROLLBACK TO bulk_chunk")
+
+            for i, params in fresh:
+                _insert_one(conn, i, params, outcomes)
+
+        if dupes:
+            _resolve_duplicates(conn, dupes, outcomes, on_duplicate)
+
+        conn.execute("RELEASE bulk_chunk")
+
+    emails = {p[_EMAIL] for i, p in pending if outcomes[i]["ok"]}
+
+    return outcomes, emails
+
+
+# --------------------------------
+# ARROW READ PATH
+# --------------------------------
+
+VIEW_COLUMNS = (
+    "id",
+    "name", "date", "amount",
+    "category", "subcategory", "bucket",
+    "spent_by", "payment_mode",
+    "notes", "other_income"
+)
+
+ALL_COLUMNS = tuple(EXPENSE_TYPES)
+
+
+def _projection(columns):
+
+    columns = tuple(columns or VIEW_COLUMNS)
+
+    unknown = set(columns) - set(EXPENSE_TYPES)
+
+    if unknown:
+        raise ValueError(f"Unknown expense columns: {sorted(unknown)}")
+
+    return ", ".join(columns)
+
+
+def _query_arrow(email, query, params):
+
+    with get_connection(email) as conn:
+        table = fetch_arrow(conn.execute(query, params))
+
+    return decode_table(table)
 
 
 # --------------------------------
 # GET USER EXPENSES (FOR DASHBOARD)
 # --------------------------------
 
-def get_user_expenses(email):
+@user_cached
+def get_user_expenses_arrow(email, columns=None):
+
+    return _read_expenses(email, columns)
+
+
+def get_user_expenses(email, columns=None, dtype_backend=None):
 
-    conn = get_connection()
+    # Only the Arrow table is cached; caching the frame as well held
+    # every user's rows twice for a conversion that costs far less
+    # than the read
+    return to_frame(
+        get_user_expenses_arrow(email, columns),
+        dtype_backend
+    )
+
+
+# --------------------------------
+# FILTERED QUERY (PREDICATE PUSHDOWN)
+# --------------------------------
+
+def build_filter(
+    email,
+    start=None,
+    end=None,
+    categories=None,
+    subcategories=None,
+    payment_modes=None,
+    spent_by=None,
+    min_amount=None,
+    max_amount=None
+):
+    """Compile filters into one parameterised WHERE clause.
+
+    Dates are inclusive and compared as epoch days, amounts as paise,
+    so every predicate is an integer range the indexes can serve.
+    """
 
-    query = """
-    SELECT
+    clauses = ["email = ?"]
+    params = [email]
 
-        id,
+    if start is not None:
+        clauses.append("date >= ?")
+        params.append(to_epoch_day(start))
 
-        name, date, amount,
+    if end is not None:
+        clauses.append("date <= ?")
+        params.append(to_epoch_day(end))
 
-        category, subcategory, bucket,
+    for column, values in (
+        ("category", categories),
+        ("subcategory", subcategories),
+        ("payment_mode", payment_modes),
+        ("spent_by", spent_by)
+    ):
 
-        spent_by, payment_mode,
+        if values:
+            marks = ", ".join("?" * len(values))
+            clauses.append(f"{column} IN ({marks})")
+            params.extend(values)
 
-        notes, other_income
+    if min_amount is not None:
+        clauses.append("amount >= ?")
+        params.append(to_paise(min_amount))
+
+    if max_amount is not None:
+        clauses.append("amount <= ?")
+        params.append(to_paise(max_amount))
+
+    return " AND ".join(clauses), params
+
+
+def _read_expenses(email, columns, after=None, limit=None, **filters):
+    """Live rows from SQLite unioned with archived Parquet rows.
+
+    Both sides are filtered at the source and come back newest first;
+    ``after``/``limit`` apply keyset paging to the combined stream.
+    """
+
+    columns = tuple(columns or VIEW_COLUMNS)
+
+    # date and id order the union and spot rows present on both sides
+    keyed = columns + tuple(k for k in ("date", "id") if k not in columns)
+
+    where, params = build_filter(email, **filters)
+
+    if after is not None:
+        where += " AND (date, id) < (?, ?)"
+        params += list(after)
+
+    query = f"""
+    SELECT {_projection(keyed)}
 
     FROM expenses
 
-    WHERE email = ?
+    WHERE {where}
+
+    ORDER BY date DESC, id DESC
+    """
+
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    table = _query_arrow(email, query, params)
+
+    cold = read_archive(email, keyed, after=after, limit=limit, **filters)
+
+    if cold is not None and cold.num_rows:
+
+        # An interrupted archive run can leave a row on both sides
+        cold = cold.filter(pc.invert(pc.is_in(cold["id"], table["id"])))
+
+        table = pa.concat_tables([table, cold]).sort_by(
+            [("date", "descending"), ("id", "descending")]
+        )
+
+        if limit is not None:
+            table = table.slice(0, limit)
+
+    return table.select(list(columns))
+
+
+@user_cached
+def query_expenses_arrow(email, columns=None, **filters):
+
+    return _read_expenses(email, columns, **filters)
+
+
+def query_expenses(email, columns=None, dtype_backend=None, **filters):
+    """Only the rows and columns asked for, filtered inside SQLite.
+
+    Filters: ``start``/``end`` dates, ``categories``, ``subcategories``,
+    ``payment_modes``, ``spent_by`` and ``min_amount``/``max_amount``.
+    Like ``get_user_expenses``, only the Arrow table is cached.
+    """
+
+    return to_frame(
+        query_expenses_arrow(email, columns, **filters),
+        dtype_backend
+    )
+
+
+def month_range(year, month):
+
+    start = date(year, month, 1)
+
+    if month == 12:
+        end = date(year + 1, 1, 1)
+    else:
+        end = date(year, month + 1, 1)
+
+    return start, date.fromordinal(end.toordinal() - 1)
+
+
+# --------------------------------
+# PAGED EXPENSES (FOR VIEW PAGE)
+# --------------------------------
+
+PAGE_SIZE = 50
+
+
+@user_cached
+def count_user_expenses(email, **filters):
+
+    where, params = build_filter(email, **filters)
+
+    cold = read_archive(email, ("date", "id"), **filters)
+
+    with get_connection(email) as conn:
+
+        count = conn.execute(
+            f"SELECT COUNT(*) FROM expenses WHERE {where}",
+            params
+        ).fetchone()[0]
 
-    ORDER BY date DESC
+        if cold is not None and cold.num_rows:
+
+            # Same rule as _read_expenses: a row still live after an
+            # interrupted archive run is counted on the live side only
+            both = conn.execute(f"""
+                SELECT COUNT(*) FROM expenses
+                WHERE {where} AND id IN (SELECT value FROM json_each(?))
+            """, params + [json.dumps(cold["id"].to_pylist())]).fetchone()[0]
+
+            count += cold.num_rows - both
+
+    return count
+
+
+@user_cached
+def get_expense_page(email, after=None, page_size=PAGE_SIZE, **filters):
+    """One page of expenses, newest first.
+
+    ``after`` is the cursor of the previous page's last row (see
+    ``page_cursor``); ``None`` starts from the newest expense. Takes the
+    same filters as ``query_expenses``.
     """
 
-    df = pd.read_sql(query, conn, params=(email,))
+    return to_frame(
+        _read_expenses(email, VIEW_COLUMNS, after, page_size, **filters)
+    )
 
-    conn.close()
 
+def page_cursor(df):
+    """Keyset cursor pointing just past the last row of ``df``."""
 
-    if not df.empty:
-        df["date"] = pd.to_datetime(df["date"])
+    last = df.iloc[-1]
 
-    return df
+    return (to_epoch_day(last["date"]), int(last["id"]))
 
 
 # --------------------------------
@@ -92,19 +640,118 @@ def get_user_expenses(email):
 
 def delete_expense(expense_id, email):
 
-    conn = get_connection()
-    cur = conn.cursor()
+    return delete_expenses([expense_id], email) > 0
+
+
+# --------------------------------
+# DELETE EXPENSES (MANY IDS)
+# --------------------------------
+
+def delete_expenses(ids, email):
+    """Delete a set of the user's expenses in one statement.
+
+    The ids travel as a single JSON array parameter, so there is no
+    bound-variable limit to chunk around. Ids that are no longer live
+    are removed from the Parquet archive. Returns the rows deleted.
+    """
+
+    ids = [int(i) for i in ids]
+
+    if not ids:
+        return 0
+
+    with get_transaction(email) as conn:
+
+        deleted = {r[0] for r in conn.execute("""
+            DELETE FROM expenses
+            WHERE email = ?
+              AND id IN (SELECT value FROM json_each(?))
+            RETURNING id
+        """, (email, json.dumps(ids)))}
+
+        rows = len(deleted)   # how many rows deleted
+
+        archived = set(ids) - deleted
+
+        if archived:
+            rows += _delete_archived(conn, email, archived)
+
+    if rows:
+        bump_version(email)
+
+    return rows
+
+
+def _delete_archived(conn, email, ids):
+
+    removed = remove_archived(email, ids)
+
+    if removed is None:
+        return 0
+
+    # No expenses row is deleted, so no trigger does this for us
+    rollup.merge_archived(conn, removed, sign=-1)
+    daily_index.merge_archived(conn, removed, sign=-1)
+
+    gone = json.dumps(removed.column("id").to_pylist())
+
+    conn.execute(
+        "DELETE FROM expenses_fts WHERE rowid IN (SELECT value FROM json_each(?))",
+        (gone,)
+    )
+    conn.execute(
+        "DELETE FROM archived_fingerprints WHERE id IN (SELECT value FROM json_each(?))",
+        (gone,)
+    )
+
+    return removed.num_rows
+
+
+# --------------------------------
+# DUPLICATE REVIEW
+# --------------------------------
+
+@user_cached
+def get_flagged_duplicates(email):
+    """Rows inserted with on_duplicate="flag" that await review."""
+
+    with get_connection(email) as conn:
+
+        cur = conn.execute("""
+            SELECT
+                id, duplicate_of,
+                date, amount,
+                category, subcategory,
+                payment_mode, notes
+            FROM expenses
+            WHERE email = ? AND duplicate_of IS NOT NULL
+            ORDER BY date DESC, id DESC
+        """, (email,))
+
+        table = fetch_arrow(cur, {**EXPENSE_TYPES, "duplicate_of": pa.int64()})
+
+    return to_frame(decode_table(table))
+
+
+def clear_duplicate_flags(ids, email):
+    """Mark flagged rows as genuine (not duplicates)."""
+
+    ids = [int(i) for i in ids]
 
-    cur.execute("""
-        DELETE FROM expenses
-        WHERE id=? AND email=?
-    """, (expense_id, email))
+    if not ids:
+        return 0
 
-    conn.commit()
+    with get_transaction(email) as conn:
 
-    rows = cur.rowcount   # how many rows deleted
+        cur = conn.execute("""
+            UPDATE expenses SET duplicate_of = NULL
+            WHERE email = ?
+              AND id IN (SELECT value FROM json_each(?))
+        """, (email, json.dumps(ids)))
 
-    conn.close()
+        rows = cur.rowcount
 
-    return rows > 0
+    if rows:
+        bump_version(email)
 
+    return rows
@@ -0,0 +1,227 @@
+import argparse
+import calendar
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+import shards
+from db_pool import connection
+from expense_db import get_connection, to_epoch_day
+from frame_cache import user_cached
+
+
+# -----------------------------------------
+# SETTINGS
+# -----------------------------------------
+
+# Days of history behind a projection; whole weeks so every weekday
+# is seen equally often
+LOOKBACK = 91
+
+# Days after which a day's weight in the run rate halves
+HALF_LIFE = 14
+
+# Active days at which the weekday profile gets half its own weight
+# (fewer -> flatter, more -> the user's own pattern)
+PROFILE_PRIOR = 14
+
+# Users per batch in forecast_all; bounds the day matrix in memory
+BATCH_USERS = 5000
+
+COLUMNS = ["email", "category", "spent_to_date", "month_end", "next_month"]
+
+
+# -----------------------------------------
+# CALENDAR
+# -----------------------------------------
+
+def weekday(day):
+    """Monday = 0 for epoch days (1970-01-01 was a Thursday)."""
+
+    return (np.asarray(day) + 3) % 7
+
+
+def weekday_counts(first, last):
+    """How many of each weekday fall in ``first``..``last`` (epoch days)."""
+
+    if last < first:
+        return np.zeros(7)
+
+    return np.bincount(weekday(np.arange(first, last + 1)), minlength=7)
+
+
+def _month_bounds(today):
+
+    start = today.replace(day=1)
+    end = today.replace(day=calendar.monthrange(today.year, today.month)[1])
+
+    following = end + timedelta(days=1)
+    following_end = following.replace(
+        day=calendar.monthrange(following.year, following.month)[1]
+    )
+
+    return [to_epoch_day(d) for d in (start, end, following, following_end)]
+
+
+# -----------------------------------------
+# ENGINE
+# -----------------------------------------
+# Every (user, category) series is a row of one day matrix. The run rate
+# is an exponentially weighted mean of past days (one matrix-vector
+# product) and the weekday profile scales it per weekday, so projecting
+# any future span is the rate times the profile summed over that span's
+# weekdays. No per-user or per-day Python.
+
+def project(frame, today):
+    """Month-end and next-month spend per (email, category).
+
+    ``frame`` holds daily totals as stored: email, category, day (epoch
+    days) and amount (paise), covering at least the LOOKBACK days up to
+    ``today``. Returns rupees, one row per series.
+    """
+
+    now = to_epoch_day(today)
+    first = now - LOOKBACK
+
+    month_start, month_end, next_start, next_end = _month_bounds(today)
+
+    frame = frame[(frame["day"] >= first) & (frame["day"] <= now)]
+
+    if frame.empty:
+        return pd.DataFrame(columns=COLUMNS)
+
+    codes, keys = pd.MultiIndex.from_frame(frame[["email", "category"]]).factorize()
+
+    # Series x day matrix in one bincount over flattened positions
+    width = LOOKBACK + 1
+
+    days = np.bincount(
+        codes * width + (frame["day"].to_numpy() - first),
+        weights=frame["amount"].to_numpy(),
+        minlength=len(keys) * width
+    ).reshape(len(keys), width)
+
+    # Today is still open: it counts as spent, not as a rate sample
+    past = days[:, :-1]
+
+    age = np.arange(LOOKBACK)[::-1]
+    weights = 0.5 ** (age / HALF_LIFE)
+
+    rate = past @ weights / weights.sum()
+
+    # Weekday profile: mean spend per weekday over overall mean,
+    # shrunk towards flat for series with few active days
+    onehot = np.eye(7)[weekday(np.arange(first, now))]
+
+    by_weekday = (past @ onehot) / onehot.sum(axis=0)
+    mean = past.mean(axis=1, keepdims=True)
+
+    raw = np.divide(by_weekday, mean, out=np.ones_like(by_weekday), where=mean > 0)
+
+    active = (past > 0).sum(axis=1, keepdims=True)
+    profile = 1 + (raw - 1) * active / (active + PROFILE_PRIOR)
+
+    rest = weekday_counts(now + 1, month_end)
+    following = weekday_counts(next_start, next_end)
+
+    spent = days[:, max(month_start - first, 0):].sum(axis=1)
+
+    result = keys.to_frame(index=False, name=["email", "category"])
+
+    result["spent_to_date"] = spent
+    result["month_end"] = spent + rate * (profile @ rest)
+    result["next_month"] = rate * (profile @ following)
+
+    money = ["spent_to_date", "month_end", "next_month"]
+    result[money] = (result[money] / 100).round(2)
+
+    return result
+
+
+# -----------------------------------------
+# READ
+# -----------------------------------------
+
+_WINDOW_SQL = """
+    SELECT email, category, day, amount
+    FROM daily_totals
+    WHERE {where} day BETWEEN ? AND ?
+"""
+
+
+def _window(conn, today, email=None):
+
+    now = to_epoch_day(today)
+
+    where, params = ("email = ? AND", (email,)) if email else ("", ())
+
+    return pd.read_sql_query(
+        _WINDOW_SQL.format(where=where),
+        conn,
+        params=params + (now - LOOKBACK, now)
+    )
+
+
+@user_cached
+def forecast_user(email, today):
+    """Projection for one user (today is part of the cache key)."""
+
+    with get_connection(email) as conn:
+        frame = _window(conn, today, email)
+
+    return project(frame, today)
+
+
+def forecast_all(today=None):
+    """Projections for every user: one window read per expense file,
+    then the engine in batches of BATCH_USERS users."""
+
+    today = today or date.today()
+
+    def read(path):
+
+        with connection(path) as conn:
+            return _window(conn, today)
+
+    # A file with nothing in the window reads back with object columns,
+    # which would make the concatenated day / amount object too
+    parts = [part for part in shards.fan_out(read) if not part.empty]
+
+    if not parts:
+        return pd.DataFrame(columns=COLUMNS)
+
+    frame = pd.concat(parts, ignore_index=True).astype(
+        {"day": "int64", "amount": "int64"}
+    )
+
+    batch = pd.factorize(frame["email"])[0] // BATCH_USERS
+
+    return pd.concat(
+        [project(part, today) for _, part in frame.groupby(batch)],
+        ignore_index=True
+    )
+
+
+# -----------------------------------------
+# CLI: python forecast.py [--out file.csv]  (nightly)
+# -----------------------------------------
+
+if __name__ == "__main__":
+
+    from migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="Project spend for all users")
+    parser.add_argument("--out", help="write the projections to this CSV")
+    args = parser.parse_args()
+
+    run_migrations()
+
+    result = forecast_all()
+
+    if args.out:
+        result.to_csv(args.out, index=False)
+
+    print(
+        f"Projected {len(result)} series for {result['email'].nunique()} users"
+    )
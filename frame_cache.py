@@ -0,0 +1,203 @@
+import functools
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import pyarrow as pa
+
+import write_behind
+
+
+# -----------------------------------------
+# SETTINGS
+# -----------------------------------------
+
+MAX_ENTRIES = 512
+
+MEMORY_BUDGET = 256 * 1024 * 1024    # bytes
+
+
+# -----------------------------------------
+# STATE (PROCESS-WIDE)
+# -----------------------------------------
+# Entries are keyed by (email, key) and remember the data version they
+# were loaded at; a write bumps the user's version, which retires every
+# entry of that user at once.
+
+_lock = threading.RLock()
+
+_versions = {}
+_entries = OrderedDict()      # (email, key) -> (version, value, size)
+_bytes = 0
+
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+# -----------------------------------------
+# DATA VERSION
+# -----------------------------------------
+
+def data_version(email):
+
+    with _lock:
+        return _versions.get(email, 0)
+
+
+def bump_version(email):
+
+    with _lock:
+
+        _versions[email] = _versions.get(email, 0) + 1
+
+        for k in [k for k in _entries if k[0] == email]:
+            _drop(k)
+
+        return _versions[email]
+
+
+# -----------------------------------------
+# INTERNALS
+# -----------------------------------------
+
+def _sizeof(value):
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum())
+
+    if isinstance(value, pa.Table):
+        return value.nbytes
+
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_sizeof(v) for v in value.values())
+
+    return sys.getsizeof(value)
+
+
+def _drop(k):
+
+    global _bytes
+
+    _, _, size = _entries.pop(k)
+    _bytes -= size
+
+
+def _evict():
+
+    while _entries and (
+        len(_entries) > MAX_ENTRIES or _bytes > MEMORY_BUDGET
+    ):
+        _drop(next(iter(_entries)))
+        _stats["evictions"] += 1
+
+
+def _share(value):
+
+    # Callers add display columns to what they get back; a shallow copy
+    # keeps that from leaking into the cached frame
+    if isinstance(value, pd.DataFrame):
+        return value.copy(deep=False)
+
+    return value
+
+
+# -----------------------------------------
+# GET OR LOAD
+# -----------------------------------------
+
+def get_or_load(email, key, loader):
+    """Return the cached value for (email, key), loading it on a miss."""
+
+    global _bytes
+
+    k = (email, key)
+
+    with _lock:
+
+        version = _versions.get(email, 0)
+        entry = _entries.get(k)
+
+        if entry is not None and entry[0] == version:
+            _entries.move_to_end(k)
+            _stats["hits"] += 1
+            return _share(entry[1])
+
+        _stats["misses"] += 1
+
+    value = loader()
+    size = _sizeof(value)
+
+    with _lock:
+
+        # A write landed while we were loading; don't cache stale data
+        if _versions.get(email, 0) != version:
+            return _share(value)
+
+        if k in _entries:
+            _drop(k)
+
+        if size <= MEMORY_BUDGET:
+            _entries[k] = (version, value, size)
+            _bytes += size
+            _evict()
+
+    return _share(value)
+
+
+def _freeze(value):
+
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+
+    return value
+
+
+def user_cached(func):
+    """Cache ``func(email, ...)`` per user, keyed on its other arguments.
+
+    Reads wait for the user's queued writes first, so a row submitted
+    through write-behind is visible on the very next rerun.
+    """
+
+    @functools.wraps(func)
+    def wrapper(email, *args, **kwargs):
+
+        write_behind.wait_for(email)
+
+        key = (
+            func.__module__,
+            func.__qualname__,
+            _freeze(args),
+            tuple(sorted((k, _freeze(v)) for k, v in kwargs.items()))
+        )
+
+        return get_or_load(email, key, lambda: func(email, *args, **kwargs))
+
+    return wrapper
+
+
+# -----------------------------------------
+# STATS / RESET
+# -----------------------------------------
+
+def cache_stats():
+
+    with _lock:
+
+        return {
+            **_stats,
+            "entries": len(_entries),
+            "bytes": _bytes
+        }
+
+
+def clear():
+
+    global _bytes
+
+    with _lock:
+        _entries.clear()
+        _bytes = 0
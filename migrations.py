@@ -0,0 +1,375 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import archive
+import daily_index
+import recurring
+import rollup
+import schema
+import search
+import shards
+from db_pool import connection, transaction
+from expense_db import fingerprint
+
+
+# -----------------------------------------
+# VERSION TABLE
+# -----------------------------------------
+
+def ensure_version_table(conn):
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    """)
+
+
+def current_version(conn):
+
+    row = conn.execute(
+        "SELECT MAX(version) FROM schema_version"
+    ).fetchone()
+
+    return row[0] or 0
+
+
+# -----------------------------------------
+# MIGRATIONS
+# -----------------------------------------
+
+def _index_expenses_email_date(conn):
+
+    # Trailing amount lets monthly sums run off the index alone
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_expenses_email_date
+        ON expenses (email, date, amount)
+    """)
+
+
+def _index_expenses_email_category(conn):
+
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_expenses_email_category
+        ON expenses (email, category, amount)
+    """)
+
+
+def _rekey_expenses_email_date(conn):
+
+    # Keyset pages order by (date, id); with amount in between SQLite
+    # needs a temp b-tree for the id tie-break, so key on (email, date)
+    # and let the implicit rowid follow
+    conn.execute("DROP INDEX IF EXISTS idx_expenses_email_date")
+
+    conn.execute("""
+        CREATE INDEX idx_expenses_email_date
+        ON expenses (email, date)
+    """)
+
+
+def _typed_expense_columns(conn):
+
+    # SQLite cannot change a column's type in place, so rebuild the
+    # table: TEXT dates -> epoch days, REAL rupees -> integer paise
+    conn.execute("""
+        CREATE TABLE expenses_typed (
+
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+
+            name TEXT,
+            date INTEGER,
+            amount INTEGER,
+
+            category TEXT,
+            subcategory TEXT,
+            bucket TEXT,
+
+            spent_by TEXT,
+            payment_mode TEXT,
+
+            notes TEXT,
+
+            other_income INTEGER DEFAULT 0,
+
+            email TEXT
+        )
+    """)
+
+    conn.execute("""
+        INSERT INTO expenses_typed
+        SELECT
+
+            id,
+            name,
+            CAST(julianday(date) - 2440587.5 AS INTEGER),
+            CAST(ROUND(amount * 100) AS INTEGER),
+
+            category, subcategory, bucket,
+
+            spent_by, payment_mode,
+
+            notes,
+
+            CAST(ROUND(COALESCE(other_income, 0) * 100) AS INTEGER),
+
+            email
+
+        FROM expenses
+    """)
+
+    conn.execute("DROP TABLE expenses")
+    conn.execute("ALTER TABLE expenses_typed RENAME TO expenses")
+
+    conn.execute("""
+        CREATE INDEX idx_expenses_email_date
+        ON expenses (email, date)
+    """)
+
+    _index_expenses_email_category(conn)
+
+
+def _monthly_rollup(conn):
+
+    rollup.create_rollup(conn)
+    rollup.backfill_rollup(conn)
+
+
+def _archive_hold(conn):
+
+    # Holds a row only inside the archive job's own transaction
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archive_hold (
+            id INTEGER PRIMARY KEY
+        )
+    """)
+
+    rollup.guard_delete_trigger(conn)
+
+
+def _search_index(conn):
+
+    search.create_search_index(conn)
+    search.backfill_search_index(conn)
+
+
+def _merge_users_db(conn):
+
+    # A transaction cannot ATTACH, so read the old file on its own
+    # connection; the file itself is left in place as a backup
+    if not os.path.exists(schema.LEGACY_USERS_DB):
+        return
+
+    old = sqlite3.connect(schema.LEGACY_USERS_DB)
+
+    try:
+
+        tables = {r[0] for r in old.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        )}
+
+        if "users" in tables:
+
+            cols = ", ".join(schema.USER_COLUMNS[1:])
+
+            # New ids; an email already here keeps its row
+            conn.executemany(
+                f"INSERT OR IGNORE INTO users ({cols}) "
+                f"VALUES ({', '.join('?' * len(schema.USER_COLUMNS[1:]))})",
+                old.execute(f"SELECT {cols} FROM users ORDER BY id")
+            )
+
+        if "expenses" in tables:
+
+            # Same conversion as step 4; rollup and search triggers fire
+            conn.executemany("""
+                INSERT INTO expenses (
+                    name, date, amount,
+                    category, subcategory, bucket,
+                    spent_by, payment_mode,
+                    notes, other_income, email
+                )
+                VALUES (
+                    ?,
+                    CAST(julianday(?) - 2440587.5 AS INTEGER),
+                    CAST(ROUND(? * 100) AS INTEGER),
+                    ?, ?, ?,
+                    ?, ?,
+                    ?,
+                    CAST(ROUND(COALESCE(?, 0) * 100) AS INTEGER),
+                    ?
+                )
+            """, old.execute("""
+                SELECT
+                    name, date, amount,
+                    category, subcategory, bucket,
+                    spent_by, payment_mode,
+                    notes, other_income, email
+                FROM expenses
+                ORDER BY id
+            """))
+
+    finally:
+        old.close()
+
+
+def _expense_fingerprints(conn):
+
+    # duplicate_of points a row flagged on insert at the row it repeats
+    conn.execute("ALTER TABLE expenses ADD COLUMN fingerprint TEXT")
+    conn.execute("ALTER TABLE expenses ADD COLUMN duplicate_of INTEGER")
+
+    rows = conn.execute("""
+        SELECT id, email, date, amount, category, subcategory, notes
+        FROM expenses
+    """)
+
+    conn.executemany(
+        "UPDATE expenses SET fingerprint = ? WHERE id = ?",
+        [(fingerprint(*row[1:]), row[0]) for row in rows]
+    )
+
+    # Not UNIQUE: existing data may already hold duplicates, and
+    # flagged rows share their original's fingerprint
+    conn.execute("""
+        CREATE INDEX idx_expenses_fingerprint
+        ON expenses (fingerprint)
+    """)
+
+
+def _recurring_rules(conn):
+
+    recurring.create_rules_table(conn)
+
+
+def _shard_map(conn):
+
+    shards.create_shard_map(conn)
+
+
+def _daily_totals(conn):
+
+    daily_index.create_daily_totals(conn)
+    daily_index.backfill_daily_totals(conn)
+
+
+def _archived_fingerprints(conn):
+
+    archive.create_fingerprint_table(conn)
+    archive.backfill_archived_fingerprints(conn)
+
+
+def _search_owner_column(conn):
+
+    # FTS5 tables cannot gain a column in place
+    search.rebuild_search_index(conn)
+
+
+MIGRATIONS = [
+    (1, "index expenses on (email, date)", _index_expenses_email_date),
+    (2, "index expenses on (email, category)", _index_expenses_email_category),
+    (3, "re-key (email, date) index for keyset paging", _rekey_expenses_email_date),
+    (4, "store dates as epoch days and money as paise", _typed_expense_columns),
+    (5, "trigger-maintained monthly rollup", _monthly_rollup),
+    (6, "archive hold flag for rollup triggers", _archive_hold),
+    (7, "FTS5 search over notes and categories", _search_index),
+    (8, "merge users.db into the expenses database", _merge_users_db),
+    (9, "duplicate fingerprint column and index", _expense_fingerprints),
+    (10, "recurring expense rules", _recurring_rules),
+    (11, "shard map for sharded expense storage", _shard_map),
+    (12, "trigger-maintained daily totals", _daily_totals),
+    (13, "fingerprints of archived expenses", _archived_fingerprints),
+    (14, "per-user owner token in the search index", _search_owner_column),
+]
+
+# Steps about users / the catalog; shard files skip them
+CATALOG_ONLY = {8, 11}
+
+SHARD_MIGRATIONS = [m for m in MIGRATIONS if m[0] not in CATALOG_ONLY]
+
+
+# -----------------------------------------
+# RUNNER
+# -----------------------------------------
+
+def migrate(db_path, migrations):
+
+    applied = []
+
+    with connection(db_path) as conn:
+
+        ensure_version_table(conn)
+        conn.commit()
+
+        for version, name, step in migrations:
+
+            if version <= current_version(conn):
+                continue
+
+            # IMMEDIATE takes the write lock up front so two processes
+            # starting together cannot both apply the same step
+            conn.execute("BEGIN IMMEDIATE")
+
+            try:
+
+                if version <= current_version(conn):
+                    conn.rollback()
+                    continue
+
+                step(conn)
+
+                conn.execute(
+                    "INSERT INTO schema_version VALUES (?,?,?)",
+                    (version, name, datetime.now().isoformat())
+                )
+
+                conn.commit()
+
+            except Exception:
+                conn.rollback()
+                raise
+
+            applied.append(version)
+
+    return applied
+
+
+# -----------------------------------------
+# RUN ONCE AT STARTUP
+# -----------------------------------------
+
+_done = False
+_lock = threading.Lock()
+
+
+def run_migrations():
+
+    global _done
+
+    with _lock:
+
+        if _done:
+            return
+
+        # Baseline tables, then versioned steps on top
+        schema.create_tables()
+
+        migrate(schema.DB_PATH, MIGRATIONS)
+
+        if shards.sharded():
+
+            os.makedirs(shards.SHARD_DIR, exist_ok=True)
+
+            for index, path in enumerate(shards.all_paths()):
+
+                with transaction(path) as conn:
+                    conn.execute(schema.EXPENSES_TABLE)
+
+                migrate(path, SHARD_MIGRATIONS)
+                shards.prepare_shard(index)
+
+        _done = True
@@ -0,0 +1,332 @@
+import calendar
+from datetime import date, timedelta
+
+from expense_db import (
+    from_epoch_day,
+    from_paise,
+    get_connection,
+    get_transaction,
+    to_epoch_day,
+    to_paise
+)
+import shards
+from db_pool import connection, transaction
+from expense_service import write_expenses
+from frame_cache import bump_version
+
+
+# -----------------------------------------
+# SETTINGS
+# -----------------------------------------
+
+FREQUENCIES = ("monthly", "weekly", "days")
+
+# Most occurrences one rule may catch up in a single run
+MAX_CATCH_UP = 400
+
+
+# -----------------------------------------
+# TABLE
+# -----------------------------------------
+# A rule repeats every `interval` months / weeks / days from start_date.
+# next_index counts occurrences already written and next_due is the
+# date of the next one, so materializing and advancing the rule commit
+# together and a rerun never writes an occurrence twice.
+
+def create_rules_table(conn):
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recurring_rules (
+
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+
+            email TEXT NOT NULL,
+            name TEXT,
+
+            amount INTEGER NOT NULL,         -- paise
+
+            category TEXT,
+            subcategory TEXT,
+            bucket TEXT,
+
+            spent_by TEXT,
+            payment_mode TEXT,
+
+            notes TEXT,
+
+            frequency TEXT NOT NULL,
+            interval INTEGER NOT NULL DEFAULT 1,
+
+            start_date INTEGER NOT NULL,     -- epoch days
+            end_date INTEGER,
+
+            next_index INTEGER NOT NULL DEFAULT 0,
+            next_due INTEGER,                -- NULL once finished
+
+            active INTEGER NOT NULL DEFAULT 1
+        )
+    """)
+
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_recurring_due
+        ON recurring_rules (next_due)
+        WHERE active = 1
+    """)
+
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_recurring_email
+        ON recurring_rules (email)
+    """)
+
+
+# -----------------------------------------
+# SCHEDULE
+# -----------------------------------------
+
+def occurrence(frequency, interval, start, k):
+    """Date of the k-th occurrence (k = 0 is ``start``)."""
+
+    if frequency == "weekly":
+        return start + timedelta(weeks=interval * k)
+
+    if frequency == "days":
+        return start + timedelta(days=interval * k)
+
+    # Monthly keeps the start's day, clamped to short months
+    index = start.year * 12 + start.month - 1 + interval * k
+    year, month = divmod(index, 12)
+    month += 1
+
+    day = min(start.day, calendar.monthrange(year, month)[1])
+
+    return date(year, month, day)
+
+
+def _next_due(rule, k):
+
+    when = occurrence(
+        rule["frequency"], rule["interval"], from_epoch_day(rule["start_date"]), k
+    )
+
+    if rule["end_date"] is not None and to_epoch_day(when) > rule["end_date"]:
+        return None
+
+    return to_epoch_day(when)
+
+
+# -----------------------------------------
+# RULES
+# -----------------------------------------
+
+RULE_COLUMNS = (
+    "id", "email", "name", "amount",
+    "category", "subcategory", "bucket",
+    "spent_by", "payment_mode", "notes",
+    "frequency", "interval",
+    "start_date", "end_date",
+    "next_index", "next_due", "active"
+)
+
+
+def add_rule(data):
+    """Store a rule; its past occurrences appear on the next run."""
+
+    if data["frequency"] not in FREQUENCIES:
+        raise ValueError(f"frequency must be one of {FREQUENCIES}")
+
+    interval = int(data.get("interval") or 1)
+
+    if interval < 1:
+        raise ValueError("interval must be at least 1")
+
+    start = to_epoch_day(data["start_date"])
+    end = data.get("end_date")
+
+    if end is not None:
+        end = to_epoch_day(end)
+
+    with get_transaction(data["email"]) as conn:
+
+        cur = conn.execute(f"""
+            INSERT INTO recurring_rules (
+                id,
+                email, name, amount,
+                category, subcategory, bucket,
+                spent_by, payment_mode, notes,
+                frequency, interval,
+                start_date, end_date,
+                next_index, next_due
+            )
+            VALUES (
+                {shards.next_id_sql("recurring_rules")},
+                ?,?,?,?,?,?,?,?,?,?,?,?,?,0,?
+            )
+        """, (
+            data["email"], data.get("name", ""), to_paise(data["amount"]),
+            data["category"], data.get("subcategory", ""), data.get("bucket", ""),
+            data.get("spent_by", ""), data.get("payment_mode", ""),
+            data.get("notes", ""),
+            data["frequency"], interval,
+            start, end,
+            start if end is None or start <= end else None
+        ))
+
+    return cur.lastrowid
+
+
+def get_rules(email):
+
+    with get_connection(email) as conn:
+
+        rows = conn.execute(f"""
+            SELECT {", ".join(RULE_COLUMNS)}
+            FROM recurring_rules
+            WHERE email = ? AND active = 1
+            ORDER BY id
+        """, (email,)).fetchall()
+
+    rules = [dict(zip(RULE_COLUMNS, row)) for row in rows]
+
+    for rule in rules:
+
+        rule["amount"] = from_paise(rule["amount"])
+        rule["start_date"] = from_epoch_day(rule["start_date"])
+
+        if rule["next_due"] is not None:
+            rule["next_due"] = from_epoch_day(rule["next_due"])
+
+    return rules
+
+
+def stop_rule(rule_id, email):
+    """Stop future occurrences; rows already written stay."""
+
+    with get_transaction(email) as conn:
+
+        conn.execute("""
+            UPDATE recurring_rules SET active = 0
+            WHERE id = ? AND email = ?
+        """, (rule_id, email))
+
+
+# -----------------------------------------
+# MATERIALIZE
+# -----------------------------------------
+
+def _due_rules(conn, today):
+
+    rows = conn.execute(f"""
+        SELECT {", ".join(RULE_COLUMNS)}
+        FROM recurring_rules
+        WHERE active = 1 AND next_due <= ?
+    """, (today,)).fetchall()
+
+    return [dict(zip(RULE_COLUMNS, row)) for row in rows]
+
+
+def _expense_row(rule, when):
+
+    return {
+        "email": rule["email"],
+        "name": rule["name"],
+        "date": from_epoch_day(when).isoformat(),
+        "amount": from_paise(rule["amount"]),
+        "category": rule["category"],
+        "subcategory": rule["subcategory"],
+        "bucket": rule["bucket"],
+        "spent_by": rule["spent_by"],
+        "payment_mode": rule["payment_mode"],
+        "notes": rule["notes"],
+        "other_income": 0
+    }
+
+
+def materialize_due(today=None):
+    """Write every due occurrence of every rule.
+
+    Each expense file is handled in one transaction (one in total unless
+    sharded). Missed periods are caught up. Occurrences that repeat an
+    expense the user already entered are skipped by the duplicate check.
+    Returns ``{email: rows written}``.
+    """
+
+    today = to_epoch_day(today or date.today())
+
+    written = {}
+
+    for part in shards.fan_out(lambda path: _materialize(path, today)):
+
+        for email, count in part.items():
+            written[email] = written.get(email, 0) + count
+
+    for email in written:
+        bump_version(email)
+
+    return written
+
+
+def _materialize(path, today):
+
+    # Cheap read first: reruns with nothing due never take the write lock
+    with connection(path) as conn:
+
+        if not conn.execute("""
+            SELECT 1 FROM recurring_rules
+            WHERE active = 1 AND next_due <= ?
+            LIMIT 1
+        """, (today,)).fetchone():
+            return {}
+
+    with transaction(path) as conn:
+
+        conn.execute("BEGIN IMMEDIATE")
+
+        rows, advances = [], []
+
+        for rule in _due_rules(conn, today):
+
+            k, due = rule["next_index"], rule["next_due"]
+
+            caught = 0
+
+            while due is not None and due <= today and caught < MAX_CATCH_UP:
+
+                rows.append(_expense_row(rule, due))
+
+                k += 1
+                caught += 1
+                due = _next_due(rule, k)
+
+            advances.append((k, due, rule["id"]))
+
+        outcomes, _ = write_expenses(conn, rows)
+
+        conn.executemany("""
+            UPDATE recurring_rules
+            SET next_index = ?, next_due = ?
+            WHERE id = ?
+        """, advances)
+
+    written = {}
+
+    for row, outcome in zip(rows, outcomes):
+
+        if outcome["ok"]:
+            written[row["email"]] = written.get(row["email"], 0) + 1
+
+    return written
+
+
+# -----------------------------------------
+# CLI: python recurring.py  (cron / timer)
+# -----------------------------------------
+
+if __name__ == "__main__":
+
+    from migrations import run_migrations
+
+    run_migrations()
+
+    written = materialize_due()
+
+    print(f"Materialized {sum(written.values())} rows for {len(written)} users")
@@ -1,6 +1,4 @@
 import os
-import sqlite3
-import pandas as pd
 import smtplib
 import matplotlib.pyplot as plt
 
@@ -8,6 +6,14 @@ from email.message import EmailMessage
 from fpdf import FPDF
 from datetime import datetime
 
+from downsample import downsample
+from expense_service import (
+    ALL_COLUMNS,
+    month_range,
+    query_expenses
+)
+from rollup import get_month_counts
+
 
 # ---------------------------------------
 # PATHS
@@ -15,8 +21,6 @@ from datetime import datetime
 
 BASE_DIR = os.getcwd()
 
-DB_PATH = os.path.join(BASE_DIR, "data", "expenses.db")
-
 REPORT_DIR = os.path.join(BASE_DIR, "data", "reports")
 CHART_DIR = os.path.join(BASE_DIR, "data", "charts")
 
@@ -24,14 +28,6 @@ os.makedirs(REPORT_DIR, exist_ok=True)
 os.makedirs(CHART_DIR, exist_ok=True)
 
 
-# ---------------------------------------
-# DB CONNECTION
-# ---------------------------------------
-
-def get_connection():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
-
-
 # ---------------------------------------
 # CLEAN TEXT (UNICODE SAFE)
 # ---------------------------------------
@@ -52,45 +48,22 @@ def clean_text(text):
 
 
 # ---------------------------------------
-# LOAD EXPENSES FROM DB
+# LOAD ONE MONTH FROM DB
 # ---------------------------------------
 
-def load_expenses(email):
+def load_month(email, month, year):
 
-    conn = get_connection()
+    start, end = month_range(year, month)
 
-    df = pd.read_sql_query(
-        """
-        SELECT *
-        FROM expenses
-        WHERE email=?
-        """,
-        conn,
-        params=(email,)
+    df = query_expenses(
+        email,
+        ALL_COLUMNS,
+        start=start,
+        end=end
     )
 
-    conn.close()
-
-    return df
-
-
-# ---------------------------------------
-# FILTER MONTH
-# ---------------------------------------
-
-def filter_month(df, month, year):
-
-    df["date"] = pd.to_datetime(
-        df["date"],
-        errors="coerce"
-    )
-
-    df = df.dropna(subset=["date"])
-
-    return df[
-        (df["date"].dt.month == month) &
-        (df["date"].dt.year == year)
-    ]
+    # Query is newest-first; the report reads oldest-first
+    return df.iloc[::-1].reset_index(drop=True)
 
 
 # ---------------------------------------
@@ -135,7 +108,11 @@ def generate_charts(df, month, year):
         f"daily_{month}_{year}.png"
     )
 
-    daily = df.groupby("date")["amount"].sum()
+    # 8 in at 150 dpi: never more points than the image has pixels for
+    daily = downsample(
+        df.groupby("date")["amount"].sum(),
+        width=8 * 150
+    )
 
     plt.figure(figsize=(8, 4))
 
@@ -389,13 +366,12 @@ def generate_report(
     app_password=None
 ):
 
-    df = load_expenses(user["email"])
-
-    if df.empty:
+    # Any month in the rollup means the user has data (archived too)
+    if not get_month_counts(user["email"]):
         return None, "No Data Found"
 
 
-    df = filter_month(df, month, year)
+    df = load_month(user["email"], month, year)
 
     if df.empty:
         return None, "No Records For Selected Month"
@@ -0,0 +1,322 @@
+import sys
+
+import pandas as pd
+
+import shards
+from archive import archived_rows
+from db_pool import transaction
+from expense_db import decode_expenses, get_connection
+from frame_cache import user_cached
+
+
+# -----------------------------------------
+# MONTHLY ROLLUP
+# -----------------------------------------
+# One row per (email, month, category, bucket), kept current by triggers
+# on expenses so the dashboard reads O(categories) rows, not O(history).
+
+YEAR_MONTH = "strftime('%Y-%m', {row}.date * 86400, 'unixepoch')"
+
+
+def _key(row):
+
+    return (
+        f"COALESCE({row}.email, ''), "
+        f"{YEAR_MONTH.format(row=row)}, "
+        f"COALESCE({row}.category, ''), "
+        f"COALESCE({row}.bucket, '')"
+    )
+
+
+def _add(row):
+
+    return f"""
+        INSERT INTO monthly_rollup
+            (email, year_month, category, bucket,
+             expense_sum, income_sum, row_count)
+        VALUES (
+            {_key(row)},
+            COALESCE({row}.amount, 0),
+            COALESCE({row}.other_income, 0),
+            1
+        )
+        ON CONFLICT (email, year_month, category, bucket) DO UPDATE SET
+            expense_sum = expense_sum + excluded.expense_sum,
+            income_sum = income_sum + excluded.income_sum,
+            row_count = row_count + 1;
+    """
+
+
+def _subtract(row):
+
+    match = f"""
+        (email, year_month, category, bucket) = ({_key(row)})
+    """
+
+    return f"""
+        UPDATE monthly_rollup SET
+            expense_sum = expense_sum - COALESCE({row}.amount, 0),
+            income_sum = income_sum - COALESCE({row}.other_income, 0),
+            row_count = row_count - 1
+        WHERE {match};
+
+        DELETE FROM monthly_rollup
+        WHERE {match} AND row_count <= 0;
+    """
+
+
+def create_rollup(conn):
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS monthly_rollup (
+
+            email TEXT NOT NULL,
+            year_month TEXT NOT NULL,
+
+            category TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+
+            expense_sum INTEGER NOT NULL DEFAULT 0,
+            income_sum INTEGER NOT NULL DEFAULT 0,
+            row_count INTEGER NOT NULL DEFAULT 0,
+
+            PRIMARY KEY (email, year_month, category, bucket)
+        ) WITHOUT ROWID
+    """)
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_insert
+        AFTER INSERT ON expenses
+        WHEN NEW.date IS NOT NULL
+        BEGIN
+            {_add("NEW")}
+        END
+    """)
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_delete
+        AFTER DELETE ON expenses
+        WHEN OLD.date IS NOT NULL
+        BEGIN
+            {_subtract("OLD")}
+        END
+    """)
+
+    # Split in two so either side can be skipped when its date is NULL
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_update_old
+        AFTER UPDATE OF email, date, amount, other_income, category, bucket
+        ON expenses
+        WHEN OLD.date IS NOT NULL
+        BEGIN
+            {_subtract("OLD")}
+        END
+    """)
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_update_new
+        AFTER UPDATE OF email, date, amount, other_income, category, bucket
+        ON expenses
+        WHEN NEW.date IS NOT NULL
+        BEGIN
+            {_add("NEW")}
+        END
+    """)
+
+
+def guard_delete_trigger(conn):
+    """Skip the rollup on deletes made while archive_hold has a row.
+
+    The archive job moves rows to Parquet; their totals must stay.
+    """
+
+    conn.execute("DROP TRIGGER IF EXISTS trg_rollup_delete")
+
+    conn.execute(f"""
+        CREATE TRIGGER trg_rollup_delete
+        AFTER DELETE ON expenses
+        WHEN OLD.date IS NOT NULL
+         AND NOT EXISTS (SELECT 1 FROM archive_hold)
+        BEGIN
+            {_subtract("OLD")}
+        END
+    """)
+
+
+# -----------------------------------------
+# BACKFILL
+# -----------------------------------------
+
+def backfill_rollup(conn, email=None):
+
+    if email is None:
+        conn.execute("DELETE FROM monthly_rollup")
+        where, params = "WHERE e.date IS NOT NULL", ()
+
+    else:
+        conn.execute("DELETE FROM monthly_rollup WHERE email = ?", (email,))
+        where, params = "WHERE e.date IS NOT NULL AND e.email = ?", (email,)
+
+    conn.execute(f"""
+        INSERT INTO monthly_rollup
+        SELECT
+
+            COALESCE(e.email, ''),
+            {YEAR_MONTH.format(row="e")},
+            COALESCE(e.category, ''),
+            COALESCE(e.bucket, ''),
+
+            SUM(COALESCE(e.amount, 0)),
+            SUM(COALESCE(e.other_income, 0)),
+            COUNT(*)
+
+        FROM expenses e
+        {where}
+        GROUP BY 1, 2, 3, 4
+    """, params)
+
+    # Archived months are gone from expenses but keep their totals
+    table = archived_rows(conn, ARCHIVED_COLUMNS, email)
+
+    if table is not None:
+        merge_archived(conn, table)
+
+
+ARCHIVED_COLUMNS = ["email", "date", "category", "bucket", "amount", "other_income"]
+
+
+def merge_archived(conn, table, sign=1):
+    """Add (``sign=-1``: take away) raw archived rows' totals."""
+
+    df = table.select(ARCHIVED_COLUMNS).to_pandas().dropna(subset=["date"])
+
+    df["year_month"] = pd.to_datetime(df["date"], unit="D").dt.strftime("%Y-%m")
+
+    for col in ("email", "category", "bucket"):
+        df[col] = df[col].fillna("")
+
+    for col in ("amount", "other_income"):
+        df[col] = df[col].fillna(0)
+
+    months = df.groupby(["email", "year_month", "category", "bucket"]).agg(
+        amount=("amount", "sum"),
+        other_income=("other_income", "sum"),
+        rows=("amount", "size")
+    )
+
+    conn.executemany("""
+        INSERT INTO monthly_rollup
+            (email, year_month, category, bucket,
+             expense_sum, income_sum, row_count)
+        VALUES (?,?,?,?,?,?,?)
+        ON CONFLICT (email, year_month, category, bucket) DO UPDATE SET
+            expense_sum = expense_sum + excluded.expense_sum,
+            income_sum = income_sum + excluded.income_sum,
+            row_count = row_count + excluded.row_count
+    """, [
+        (*key, sign * int(amount), sign * int(income), sign * int(rows))
+        for key, amount, income, rows in zip(
+            months.index, months["amount"], months["other_income"], months["rows"]
+        )
+    ])
+
+    if sign < 0:
+        conn.executemany(
+            "DELETE FROM monthly_rollup WHERE email = ? AND row_count <= 0",
+            [(e,) for e in df["email"].unique()]
+        )
+
+
+# -----------------------------------------
+# READ
+# -----------------------------------------
+
+@user_cached
+def get_month_rollup(email, year_month):
+    """Category totals for one month, in rupees."""
+
+    with get_connection(email) as conn:
+
+        df = pd.read_sql_query(
+            """
+            SELECT
+                category,
+                bucket,
+                expense_sum AS amount,
+                income_sum AS other_income,
+                row_count
+            FROM monthly_rollup
+            WHERE email = ? AND year_month = ?
+            """,
+            conn,
+            params=(email, year_month)
+        )
+
+    return decode_expenses(df)
+
+
+@user_cached
+def get_rollup_range(email, first, last):
+    """Category totals of every month from ``first`` to ``last``
+    ("YYYY-MM", inclusive), in rupees, from one range scan."""
+
+    with get_connection(email) as conn:
+
+        df = pd.read_sql_query(
+            """
+            SELECT
+                year_month,
+                category,
+                bucket,
+                expense_sum AS amount,
+                income_sum AS other_income,
+                row_count
+            FROM monthly_rollup
+            WHERE email = ? AND year_month BETWEEN ? AND ?
+            ORDER BY year_month
+            """,
+            conn,
+            params=(email, first, last)
+        )
+
+    return decode_expenses(df)
+
+
+@user_cached
+def get_month_counts(email):
+    """Months that have expenses, newest first, with their row counts.
+
+    Reads the rollup's primary key range for the user; archived months
+    are included since archiving leaves the rollup alone.
+    """
+
+    with get_connection(email) as conn:
+
+        rows = conn.execute("""
+            SELECT year_month, SUM(row_count)
+            FROM monthly_rollup
+            WHERE email = ?
+            GROUP BY year_month
+            HAVING SUM(row_count) > 0
+            ORDER BY year_month DESC
+        """, (email,)).fetchall()
+
+    return dict(rows)
+
+
+# -----------------------------------------
+# CLI: python rollup.py [email]
+# -----------------------------------------
+
+if __name__ == "__main__":
+
+    target = sys.argv[1] if len(sys.argv) > 1 else None
+
+    def rebuild(path):
+
+        with transaction(path) as conn:
+            backfill_rollup(conn, target)
+
+    shards.fan_out(rebuild)
+
+    print(f"Rollup rebuilt for {target or 'all users'}")
@@ -0,0 +1,108 @@
+import os
+
+from db_pool import connection, transaction
+
+
+# -----------------------------------------
+# ONE DATABASE
+# -----------------------------------------
+# Users and expenses live in the same file so a request opens one
+# pooled connection and can join salary against spend directly.
+
+DB_PATH = "data/expenses.db"
+
+# Users (and an unused expenses copy) used to live here; migration 8
+# merges it into DB_PATH
+LEGACY_USERS_DB = "data/users.db"
+
+
+def get_connection():
+
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+
+    return connection(DB_PATH)
+
+
+def get_transaction():
+
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+
+    return transaction(DB_PATH)
+
+
+# -----------------------------------------
+# BASE TABLES
+# -----------------------------------------
+# Version 0 of the schema. Everything after this (typed columns,
+# indexes, rollup, search) is a numbered step in migrations.py.
+
+USERS_TABLE = """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+
+        name TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+
+        phone TEXT,
+        dob TEXT,
+
+        salary REAL,
+
+        gender TEXT,
+        job TEXT,
+
+        address TEXT,
+
+        pic TEXT,
+        notify TEXT
+    )
+"""
+
+EXPENSES_TABLE = """
+    CREATE TABLE IF NOT EXISTS expenses (
+
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+
+        name TEXT,
+        date TEXT,
+        amount REAL,
+
+        category TEXT,
+        subcategory TEXT,
+        bucket TEXT,
+
+        spent_by TEXT,
+        payment_mode TEXT,
+
+        notes TEXT,
+
+        other_income REAL DEFAULT 0,
+
+        email TEXT
+    )
+"""
+
+# Stored column order of expenses (after migration 4: date is epoch
+# days, amount / other_income are paise)
+EXPENSE_COLUMNS = (
+    "id", "name", "date", "amount",
+    "category", "subcategory", "bucket",
+    "spent_by", "payment_mode",
+    "notes", "other_income", "email"
+)
+
+USER_COLUMNS = (
+    "id", "name", "email", "password",
+    "phone", "dob", "salary",
+    "gender", "job", "address",
+    "pic", "notify"
+)
+
+
+def create_tables():
+
+    with get_transaction() as conn:
+
+        conn.execute(USERS_TABLE)
+        conn.execute(EXPENSES_TABLE)
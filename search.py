@@ -0,0 +1,187 @@
+import re
+
+import pandas as pd
+
+from archive import archived_rows
+from expense_db import decode_expenses, get_connection
+from frame_cache import user_cached
+
+
+# -----------------------------------------
+# FULL-TEXT INDEX
+# -----------------------------------------
+# The FTS table keeps its own copy of the searchable text (rowid is the
+# expense id), so rows moved to the Parquet archive stay findable.
+#
+# owner holds one token per user (the email's UTF-8 bytes in hex, as
+# SQLite's hex() writes them) and every query matches it, so FTS only
+# walks that user's postings instead of ranking everyone's matches and
+# filtering on email after.
+
+SEARCH_LIMIT = 20
+
+_FIELDS = "email, owner, date, amount, notes, category, subcategory"
+
+
+def owner_token(email):
+
+    return "u" + (email or "").encode().hex().upper()
+
+
+def _owner_sql(email):
+
+    # Same token as owner_token, for triggers and bulk SQL
+    return f"'u' || hex({email})"
+
+
+def create_search_index(conn):
+
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5 (
+            email UNINDEXED,
+            owner,
+            date UNINDEXED,
+            amount UNINDEXED,
+            notes,
+            category,
+            subcategory,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_fts_insert
+        AFTER INSERT ON expenses
+        BEGIN
+            INSERT INTO expenses_fts (rowid, {_FIELDS})
+            VALUES (
+                NEW.id, NEW.email, {_owner_sql("NEW.email")},
+                NEW.date, NEW.amount,
+                NEW.notes, NEW.category, NEW.subcategory
+            );
+        END
+    """)
+
+    # Archiving deletes rows from expenses but they stay searchable
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_fts_delete
+        AFTER DELETE ON expenses
+        WHEN NOT EXISTS (SELECT 1 FROM archive_hold)
+        BEGIN
+            DELETE FROM expenses_fts WHERE rowid = OLD.id;
+        END
+    """)
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_fts_update
+        AFTER UPDATE OF email, date, amount, notes, category, subcategory
+        ON expenses
+        BEGIN
+            UPDATE expenses_fts SET
+                email = NEW.email,
+                owner = {_owner_sql("NEW.email")},
+                date = NEW.date,
+                amount = NEW.amount,
+                notes = NEW.notes,
+                category = NEW.category,
+                subcategory = NEW.subcategory
+            WHERE rowid = OLD.id;
+        END
+    """)
+
+
+def backfill_search_index(conn):
+
+    conn.execute("DELETE FROM expenses_fts")
+
+    conn.execute(f"""
+        INSERT INTO expenses_fts (rowid, {_FIELDS})
+        SELECT
+            id, email, {_owner_sql("email")},
+            date, amount, notes, category, subcategory
+        FROM expenses
+    """)
+
+    table = archived_rows(conn, [
+        "id", "email", "date", "amount", "notes", "category", "subcategory"
+    ])
+
+    if table is None:
+        return
+
+    table = table.add_column(2, "owner", [
+        [owner_token(e) for e in table.column("email").to_pylist()]
+    ])
+
+    conn.executemany(
+        f"INSERT OR REPLACE INTO expenses_fts (rowid, {_FIELDS}) "
+        "VALUES (?,?,?,?,?,?,?,?)",
+        zip(*(table.column(c).to_pylist() for c in table.column_names))
+    )
+
+
+def rebuild_search_index(conn):
+    """Drop and recreate the FTS table and its triggers, then backfill."""
+
+    conn.execute("DROP TABLE IF EXISTS expenses_fts")
+
+    for trigger in ("trg_fts_insert", "trg_fts_delete", "trg_fts_update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+    create_search_index(conn)
+    backfill_search_index(conn)
+
+
+# -----------------------------------------
+# QUERY
+# -----------------------------------------
+
+def match_expression(text):
+    """Free text -> FTS5 query: any word, each as a prefix.
+
+    Words are quoted so user input can never form FTS syntax; bm25
+    ranks rows matching more of the words first. Only the text columns
+    are searched, never owner.
+    """
+
+    words = re.findall(r"\w+", text.lower())
+
+    if not words:
+        return ""
+
+    return "{notes category subcategory} : (" + " OR ".join(
+        f'"{w}"*' for w in words
+    ) + ")"
+
+
+@user_cached
+def search_expenses(email, query, limit=SEARCH_LIMIT):
+    """Best-ranked expenses whose notes or categories match ``query``."""
+
+    expr = match_expression(query)
+
+    if not expr:
+        return pd.DataFrame(
+            columns=["id", "date", "amount", "category", "subcategory", "notes"]
+        )
+
+    with get_connection(email) as conn:
+
+        df = pd.read_sql_query(
+            """
+            SELECT
+                rowid AS id,
+                date, amount,
+                category, subcategory,
+                notes
+            FROM expenses_fts
+            WHERE expenses_fts MATCH ?
+            ORDER BY bm25(expenses_fts, 0, 0, 0, 0, 4.0, 1.0, 2.0)
+            LIMIT ?
+            """,
+            conn,
+            params=(f'owner : "{owner_token(email)}" AND {expr}', limit)
+        )
+
+    return decode_expenses(df)
@@ -0,0 +1,428 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import schema
+from db_pool import connection, transaction
+
+
+# -----------------------------------------
+# SETTINGS
+# -----------------------------------------
+# EXPENSE_SHARDS=N (N > 1) spreads users' expenses over N SQLite files
+# so writers of different users stop queueing on one lock. Users and the
+# shard map stay in the main database (the catalog).
+
+SHARD_COUNT = max(1, int(os.environ.get("EXPENSE_SHARDS", "1")))
+
+SHARD_DIR = "data/shards"
+
+# Shard i hands out ids from (i + 1) * ID_RANGE, so a user's rows keep
+# their ids when rebalancing moves them to another file
+ID_RANGE = 10 ** 12
+
+
+def sharded():
+
+    return SHARD_COUNT > 1
+
+
+def shard_path(index):
+
+    return os.path.join(SHARD_DIR, f"expenses-{index:02d}.db")
+
+
+def all_paths():
+
+    if not sharded():
+        return [schema.DB_PATH]
+
+    return [shard_path(i) for i in range(SHARD_COUNT)]
+
+
+def hash_shard(email, count=None):
+
+    count = count or SHARD_COUNT
+
+    digest = hashlib.blake2b(email.strip().lower().encode()).digest()
+
+    return int.from_bytes(digest[:8], "big") % count
+
+
+# -----------------------------------------
+# SHARD MAP (CATALOG)
+# -----------------------------------------
+# A user is placed by hash on first use and the map pins them there;
+# changing SHARD_COUNT only moves people when rebalance() runs.
+
+def create_shard_map(conn):
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS shard_map (
+            email TEXT PRIMARY KEY,
+            shard INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+
+# AUTOINCREMENT tables; the others reuse these ids
+SEQUENCE_TABLES = ("expenses", "recurring_rules")
+
+
+def next_id_sql(table):
+    """SQL for the next id of ``table`` taken from its sequence alone.
+
+    Plain AUTOINCREMENT uses MAX(seq, largest id) + 1, and a shard can
+    hold rows moved in from a higher range; inserts pass this as the id
+    so new rows stay in the shard's own range. NULL (no sequence row
+    yet) falls back to the usual choice.
+    """
+
+    return f"(SELECT seq + 1 FROM sqlite_sequence WHERE name = '{table}')"
+
+
+def _own_sequences(conn, index, issued=None):
+    """Point every sequence of shard ``index`` back into its own range.
+
+    ``issued`` maps table -> sequence value read before rows with
+    foreign-range ids were copied in; ids this shard handed out earlier
+    (and may since have moved away) are then never issued again.
+    """
+
+    base = (index + 1) * ID_RANGE
+
+    for table in SEQUENCE_TABLES:
+
+        seq = (issued or {}).get(table)
+
+        if seq is None:
+            row = conn.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)
+            ).fetchone()
+            seq = row and row[0]
+
+        if seq is None or not base <= seq < base + ID_RANGE:
+            seq = base
+
+        top = conn.execute(
+            f"SELECT MAX(id) FROM {table} WHERE id >= ? AND id < ?",
+            (base, base + ID_RANGE)
+        ).fetchone()[0]
+
+        seq = max(seq, top or base)
+
+        conn.execute(
+            "UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (seq, table)
+        )
+
+        conn.execute("""
+            INSERT INTO sqlite_sequence (name, seq)
+            SELECT ?, ?
+            WHERE NOT EXISTS (
+                SELECT 1 FROM sqlite_sequence WHERE name = ?
+            )
+        """, (table, seq, table))
+
+
+def prepare_shard(index):
+    """Make sure shard ``index`` hands out ids from its own range."""
+
+    with transaction(shard_path(index)) as conn:
+        _own_sequences(conn, index)
+
+
+_placements = {}
+_lock = threading.Lock()
+
+
+def shard_of(email):
+    """Shard index of ``email`` without recording a placement."""
+
+    with _lock:
+        index = _placements.get(email)
+
+    if index is not None:
+        return index
+
+    with connection(schema.DB_PATH) as conn:
+
+        row = conn.execute(
+            "SELECT shard FROM shard_map WHERE email = ?", (email,)
+        ).fetchone()
+
+    return hash_shard(email) if row is None else row[0]
+
+
+def db_path(email=None):
+    """File holding ``email``'s expenses (the catalog when unsharded)."""
+
+    if not sharded() or not email:
+        return schema.DB_PATH
+
+    with _lock:
+        index = _placements.get(email)
+
+    if index is None:
+
+        with transaction(schema.DB_PATH) as conn:
+
+            conn.execute(
+                "INSERT OR IGNORE INTO shard_map VALUES (?, ?)",
+                (email, hash_shard(email))
+            )
+
+            index = conn.execute(
+                "SELECT shard FROM shard_map WHERE email = ?", (email,)
+            ).fetchone()[0]
+
+        with _lock:
+            _placements[email] = index
+
+    return shard_path(index)
+
+
+# -----------------------------------------
+# FAN-OUT
+# -----------------------------------------
+
+_pool = None
+
+
+def fan_out(func):
+    """``func(path)`` on every expense file, in parallel; results in order."""
+
+    global _pool
+
+    paths = all_paths()
+
+    if len(paths) == 1:
+        return [func(paths[0])]
+
+    with _lock:
+
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=SHARD_COUNT, thread_name_prefix="shard"
+            )
+
+    return list(_pool.map(func, paths))
+
+
+# -----------------------------------------
+# REBALANCE
+# -----------------------------------------
+
+def _columns(conn, table):
+
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+
+
+# Trigger-maintained totals; they also cover archived rows, so they are
+# copied whole rather than rebuilt from the moved expenses
+AGGREGATES = ("monthly_rollup", "daily_totals")
+
+
+def _claimed(conn, table, key, email, ids):
+    """Ids among ``ids`` that ``table`` already holds for another user."""
+
+    return [r[0] for r in conn.execute(f"""
+        SELECT {key} FROM {table}
+        WHERE {key} IN (SELECT value FROM json_each(?))
+          AND email IS NOT ?
+    """, (json.dumps(ids), email))]
+
+
+def _move_user(email, source, index):
+
+    target = shard_path(index)
+
+    # Search entries of archived rows have no expenses row to carry
+    # them over through the triggers, so they move on their own
+    fts = "rowid, email, owner, date, amount, notes, category, subcategory"
+
+    with connection(source) as src:
+
+        tables = {}
+
+        for table in ("expenses", "recurring_rules", "archived_fingerprints"):
+
+            cols = ", ".join(_columns(src, table))
+
+            tables[table] = (cols, src.execute(
+                f"SELECT {cols} FROM {table} WHERE email = ?", (email,)
+            ).fetchall())
+
+        archived = src.execute(f"""
+            SELECT {fts} FROM expenses_fts
+            WHERE email = ?
+              AND rowid NOT IN (SELECT id FROM expenses WHERE email = ?)
+        """, (email, email)).fetchall()
+
+        totals = {
+            table: src.execute(
+                f"SELECT * FROM {table} WHERE email = ?", (email,)
+            ).fetchall()
+            for table in AGGREGATES
+        }
+
+    # Target first, then source: a crash in between leaves a copy that
+    # the next run skips (same ids) before deleting the original
+    with transaction(target) as dst:
+
+        dst.execute("BEGIN IMMEDIATE")
+
+        # Only this user's own earlier copy may already hold an id;
+        # anyone else's row there would be lost by the source DELETE
+        for table, key, ids in [
+            (table, "id", [r[cols.split(", ").index("id")] for r in rows])
+            for table, (cols, rows) in tables.items()
+        ] + [("expenses_fts", "rowid", [r[0] for r in archived])]:
+
+            clash = _claimed(dst, table, key, email, ids)
+
+            if clash:
+                raise RuntimeError(
+                    f"Cannot move {email} to {target}: {table} ids "
+                    f"{clash[:5]} belong to another user"
+                )
+
+        issued = dict(dst.execute(
+            "SELECT name, seq FROM sqlite_sequence WHERE name IN (?, ?)",
+            SEQUENCE_TABLES
+        ))
+
+        for table, (cols, rows) in tables.items():
+
+            dst.executemany(
+                f"INSERT OR IGNORE INTO {table} ({cols}) "
+                f"VALUES ({', '.join('?' * (cols.count(',') + 1))})",
+                rows
+            )
+
+        dst.executemany(
+            f"INSERT OR REPLACE INTO expenses_fts ({fts}) VALUES (?,?,?,?,?,?,?,?)",
+            archived
+        )
+
+        # The inserts above only added the live rows' share
+        for table, rows in totals.items():
+
+            dst.execute(f"DELETE FROM {table} WHERE email = ?", (email,))
+
+            if rows:
+                dst.executemany(
+                    f"INSERT INTO {table} VALUES ({', '.join('?' * len(rows[0]))})",
+                    rows
+                )
+
+        # AUTOINCREMENT followed the copied ids into the source shard's
+        # range; left there, this shard would reissue that shard's ids
+        _own_sequences(dst, index, issued)
+
+    with transaction(source) as src:
+
+        for table in tables:
+            src.execute(f"DELETE FROM {table} WHERE email = ?", (email,))
+
+        for table in ("expenses_fts",) + AGGREGATES:
+            src.execute(f"DELETE FROM {table} WHERE email = ?", (email,))
+
+    return len(tables["expenses"][1])
+
+
+def rebalance():
+    """Move every user to their hash shard under the current SHARD_COUNT.
+
+    Also drains expenses written before sharding was switched on out of
+    the catalog. Run with the app stopped; returns ``{email: rows}``.
+    """
+
+    from frame_cache import bump_version
+
+    if not sharded():
+        return {}
+
+    targets = all_paths()
+    sources = [schema.DB_PATH] + targets
+
+    # Shards left over from a larger count are drained too
+    if os.path.isdir(SHARD_DIR):
+
+        sources += sorted(
+            os.path.join(SHARD_DIR, name)
+            for name in os.listdir(SHARD_DIR)
+            if name.endswith(".db")
+            and os.path.join(SHARD_DIR, name) not in targets
+        )
+
+    moved = {}
+
+    for source in sources:
+
+        with connection(source) as conn:
+
+            emails = [r[0] for r in conn.execute(
+                "SELECT email FROM expenses WHERE email IS NOT NULL "
+                "UNION SELECT email FROM recurring_rules "
+                "UNION SELECT email FROM expenses_fts WHERE email IS NOT NULL"
+            )]
+
+        for email in emails:
+
+            index = hash_shard(email)
+
+            if targets[index] != source:
+                moved[email] = moved.get(email, 0) + _move_user(
+                    email, source, index
+                )
+
+            with transaction(schema.DB_PATH) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO shard_map VALUES (?, ?)",
+                    (email, index)
+                )
+
+    with _lock:
+        _placements.clear()
+
+    for email in moved:
+        bump_version(email)
+
+    return moved
+
+
+def shard_sizes():
+
+    def count(path):
+
+        with connection(path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+
+    return dict(zip(all_paths(), fan_out(count)))
+
+
+# -----------------------------------------
+# CLI: python shards.py [status|rebalance]
+# -----------------------------------------
+
+if __name__ == "__main__":
+
+    from migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="Expense shard tools")
+    parser.add_argument("command", choices=["status", "rebalance"])
+    args = parser.parse_args()
+
+    run_migrations()
+
+    if args.command == "rebalance":
+
+        moved = rebalance()
+
+        print(f"Moved {sum(moved.values())} rows for {len(moved)} users")
+
+    for path, rows in shard_sizes().items():
+        print(f"{path}: {rows} rows")
@@ -0,0 +1,204 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+# -----------------------------------------
+# SETTINGS
+# -----------------------------------------
+
+ENABLED = os.environ.get("EXPENSE_WRITE_BEHIND", "") == "1"
+
+MAX_BATCH = 200          # rows per commit
+MAX_DELAY = 0.05         # seconds to wait for a batch to fill
+
+
+# -----------------------------------------
+# WRITE-BEHIND QUEUE
+# -----------------------------------------
+
+class WriteBehindQueue:
+    """Single background writer that commits queued rows in batches.
+
+    ``writer`` takes a list of row dicts (plus any keyword options given
+    to ``submit``), writes them in one transaction and returns one
+    outcome per row (see ``add_expenses_bulk``).
+    """
+
+    def __init__(self, writer, max_batch=MAX_BATCH, max_delay=MAX_DELAY):
+
+        self.writer = writer
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+
+        self._queue = queue.Queue()
+        self._cond = threading.Condition()
+
+        # Rows are numbered as submitted; the writer drains in order,
+        # so "everything up to N is durable" is a single counter
+        self._submitted = 0
+        self._committed = 0
+        self._last_seq = {}
+
+        self._thread = threading.Thread(
+            target=self._run,
+            name="expense-write-behind",
+            daemon=True
+        )
+        self._thread.start()
+
+        atexit.register(self.close)
+
+    # ---------- producer side ----------
+
+    def submit(self, data, **options):
+
+        future = Future()
+
+        with self._cond:
+
+            self._submitted += 1
+            seq = self._submitted
+
+            self._last_seq[data["email"]] = seq
+            self._queue.put((seq, data, options, future))
+
+        return future
+
+    def wait_for(self, email, timeout=None):
+        """Block until every row this user submitted so far is committed."""
+
+        with self._cond:
+
+            target = self._last_seq.get(email, 0)
+
+            return self._cond.wait_for(
+                lambda: self._committed >= target,
+                timeout
+            )
+
+    def flush(self, timeout=None):
+
+        with self._cond:
+
+            target = self._submitted
+
+            return self._cond.wait_for(
+                lambda: self._committed >= target,
+                timeout
+            )
+
+    def close(self, timeout=None):
+
+        if not self._thread.is_alive():
+            return
+
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    # ---------- writer thread ----------
+
+    def _next_batch(self):
+
+        item = self._queue.get()
+
+        if item is None:
+            return None, True
+
+        batch = [item]
+        deadline = time.monotonic() + self.max_delay
+
+        while len(batch) < self.max_batch:
+
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                break
+
+            try:
+                item = self._queue.get(timeout=remaining)
+
+            except queue.Empty:
+                break
+
+            if item is None:
+                return batch, True
+
+            batch.append(item)
+
+        return batch, False
+
+    def _run(self):
+
+        stop = False
+
+        while not stop:
+
+            batch, stop = self._next_batch()
+
+            if batch:
+                self._commit(batch)
+
+    def _commit(self, batch):
+
+        # One writer call per distinct set of options, in arrival order
+        groups = {}
+
+        for item in batch:
+            groups.setdefault(tuple(sorted(item[2].items())), []).append(item)
+
+        try:
+
+            for options, items in groups.items():
+                self._write(items, dict(options))
+
+        finally:
+
+            with self._cond:
+                self._committed = batch[-1][0]
+                self._cond.notify_all()
+
+    def _write(self, items, options):
+
+        try:
+            outcomes = self.writer([data for _, data, _, _ in items], **options)
+
+            for (_, _, _, future), outcome in zip(items, outcomes):
+                future.set_result(outcome)
+
+        except Exception as e:
+
+            for _, _, _, future in items:
+                future.set_exception(e)
+
+
+# -----------------------------------------
+# PROCESS-WIDE INSTANCE
+# -----------------------------------------
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue(writer):
+
+    global _queue
+
+    with _queue_lock:
+
+        if _queue is None:
+            _queue = WriteBehindQueue(writer)
+
+        return _queue
+
+
+def wait_for(email, timeout=None):
+    """Read-your-writes barrier; a no-op when write-behind is unused."""
+
+    if _queue is None:
+        return True
+
+    return _queue.wait_for(email, timeout)